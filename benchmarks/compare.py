@@ -0,0 +1,46 @@
+"""
+Compares two benchmark result files and exits non-zero if any benchmark's
+p50 regressed by more than the threshold.
+
+    python -m benchmarks.compare baseline.json results.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    print(f"{'size':<8}{'benchmark':<28}{'base p50':>12}{'new p50':>12}{'change':>9}")
+    for size_name, size_results in current["results"].items():
+        if size_name not in baseline["results"]:
+            continue
+        base_benchmarks = baseline["results"][size_name]["benchmarks"]
+        for name, stats in size_results["benchmarks"].items():
+            if name not in base_benchmarks:
+                continue
+            base = base_benchmarks[name]["p50_ms"]
+            new = stats["p50_ms"]
+            change = (new - base) / base if base > 0 else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions.append((size_name, name, change))
+            print(f"{size_name:<8}{name:<28}{base:>12.2f}{new:>12.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline", type=str)
+    parser.add_argument("current", type=str)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    print(f"baseline {baseline.get('commit')}  current {current.get('commit')}")
+    regressions = compare(baseline, current, args.threshold)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,131 @@
+"""
+Deterministic stand-ins for SAM so benchmarks run on a CPU-only box without
+checkpoints. Masks are disks around positive clicks and filled boxes, and the
+low-res logits agree with them, so every downstream stage sees realistic data.
+"""
+import numpy as np
+
+from salt.onnx_model import OnnxModels, OnnxSam
+from salt.utils import get_preprocess_shape
+
+
+def fake_low_res_logits(image_shape, point_coords, point_labels, box, radius_frac=0.08):
+    h, w = image_shape
+    scale = 256 / max(h, w)
+    yy, xx = np.mgrid[0:256, 0:256].astype(np.float32)
+    logits = np.full((256, 256), -10.0, dtype=np.float32)
+    radius = radius_frac * 256
+    if point_coords is not None:
+        for (x, y), label in zip(point_coords, point_labels):
+            dist = np.sqrt((xx - x * scale) ** 2 + (yy - y * scale) ** 2)
+            disk = radius - dist
+            if label == 1:
+                logits = np.maximum(logits, disk)
+            else:
+                logits = np.minimum(logits, -disk)
+    if box is not None:
+        x0, y0, x1, y1 = np.asarray(box, dtype=np.float32).reshape(-1)[:4] * scale
+        inside = np.minimum.reduce([xx - x0, x1 - xx, yy - y0, y1 - yy])
+        logits = np.maximum(logits, inside)
+    return logits
+
+
+def upsample_logits(logits, image_shape):
+    h, w = image_shape
+    new_h, new_w = get_preprocess_shape(h, w, 256)
+    # nearest neighbour is enough here, the benchmark measures the pipeline
+    # around the model, not the fidelity of the masks
+    rows = (np.arange(h) * new_h // h).clip(0, 255)
+    cols = (np.arange(w) * new_w // w).clip(0, 255)
+    return logits[rows][:, cols]
+
+
+class FakePredictor:
+    def __init__(self, encode_seconds=0.0):
+        self.encode_seconds = encode_seconds
+        self.original_size = None
+
+    def set_image(self, image, image_format="RGB"):
+        self.original_size = image.shape[:2]
+        if self.encode_seconds:
+            # stands in for the encoder's cost without burning CPU
+            import time
+
+            time.sleep(self.encode_seconds)
+
+    def predict(
+        self,
+        point_coords=None,
+        point_labels=None,
+        box=None,
+        mask_input=None,
+        multimask_output=False,
+    ):
+        logits = fake_low_res_logits(self.original_size, point_coords, point_labels, box)
+        if multimask_output:
+            low_res = np.stack([logits - 2.0, logits, logits + 2.0])
+            iou_predictions = np.array([0.7, 0.9, 0.8], dtype=np.float32)
+        else:
+            low_res = logits[None, :, :]
+            iou_predictions = np.array([0.9], dtype=np.float32)
+        masks = np.stack([upsample_logits(l, self.original_size) > 0 for l in low_res])
+        return masks, iou_predictions, low_res
+
+    def predict_low_res(self, **kwargs):
+        _, iou_predictions, low_res = self.predict(**kwargs)
+        return iou_predictions, low_res
+
+    def predict_boxes_low_res(self, boxes):
+        low_res = np.stack(
+            [fake_low_res_logits(self.original_size, None, None, box)[None] for box in boxes]
+        )
+        return np.full((len(boxes), 1), 0.9, dtype=np.float32), low_res
+
+
+class FakeSam:
+    def __init__(self, encode_seconds=0.0):
+        self.encode_seconds = encode_seconds
+
+    def create_predictor(self):
+        return FakePredictor(self.encode_seconds)
+
+
+class FakeEncoder:
+    def encode(self, image, image_format="RGB"):
+        return (
+            np.zeros((1, 256, 64, 64), dtype=np.float32),
+            np.zeros((4, 1, 64, 64, 1280), dtype=np.float32),
+        )
+
+
+class FakeDecoderSession:
+    def run(self, output_names, inputs):
+        h, w = inputs["orig_im_size"].astype(int)
+        # coordinates are in the 1024 input frame
+        coords = inputs["point_coords"][0]
+        labels = inputs["point_labels"][0]
+        points = coords[labels == 1]
+        box = None
+        if (labels == 2).any():
+            box = np.concatenate([coords[labels == 2][0], coords[labels == 3][0]])
+        logits = fake_low_res_logits(
+            (1024, 1024), points, np.ones(len(points)), box
+        )
+        masks = upsample_logits(logits, (h, w))[None, None, :, :]
+        iou_predictions = np.array([[0.9]], dtype=np.float32)
+        return masks, iou_predictions, logits[None, None, :, :]
+
+
+def fake_onnx_sam():
+    """
+    An OnnxSam whose encoder and decoder session are fakes, to exercise the
+    ONNX glue code without model files.
+    """
+    decoder = OnnxModels.__new__(OnnxModels)
+    decoder.threshold = 0.0
+    decoder.ort_session = FakeDecoderSession()
+    decoder.ort_multimask_session = None
+    sam = OnnxSam.__new__(OnnxSam)
+    sam.encoder = FakeEncoder()
+    sam.decoder = decoder
+    return sam
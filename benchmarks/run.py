@@ -0,0 +1,232 @@
+"""
+Runs the SALT benchmark suite against synthetic datasets with a fake SAM and
+writes machine-readable results.
+
+    python -m benchmarks.run --sizes small,medium --output results.json
+    python -m benchmarks.compare baseline.json results.json
+"""
+import argparse
+import json
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import wait
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.fakes import FakeSam, fake_onnx_sam
+from benchmarks.synthetic import make_dataset
+from salt.editor import Editor
+from salt.export import export_dataset
+
+SIZES = {
+    "small": {"num_images": 100, "resolution": (768, 1024), "annotations_per_image": 5},
+    "medium": {"num_images": 2000, "resolution": (1500, 2250), "annotations_per_image": 20},
+    "large": {"num_images": 20000, "resolution": (3000, 4000), "annotations_per_image": 50},
+    "huge": {"num_images": 100000, "resolution": (1500, 2250), "annotations_per_image": 10},
+    # camera frames, the only size large enough for reduced proxies
+    "photo": {"num_images": 200, "resolution": (4000, 6000), "annotations_per_image": 10},
+}
+
+
+def measure(fn, repeats, setup=None):
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    return {
+        "n": len(timings),
+        "mean_ms": float(timings.mean()),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p90_ms": float(np.percentile(timings, 90)),
+        "min_ms": float(timings.min()),
+    }
+
+
+def new_editor(dataset_path, sam):
+    editor = Editor(
+        None, dataset_path, dataset_json_path=Path(dataset_path) / "annotations.json"
+    )
+    if sam is not None:
+        editor.set_model(sam)
+        editor.attach_predictor()
+    return editor
+
+
+def close_editors(editors):
+    # the decode pools of earlier editors would compete with the next measurement
+    while editors:
+        image_loader = editors.pop().dataset_explorer.image_loader
+        if image_loader is not None:
+            image_loader.shutdown()
+
+
+def wait_for_workers(editor):
+    # spawned decode workers importing cv2 would compete with the measurement
+    image_loader = editor.dataset_explorer.image_loader
+    if image_loader is not None:
+        wait(image_loader.warmups)
+
+
+def click_points(editor, rng, count):
+    h, w = editor.image_bgr.shape[:2]
+    return [[int(rng.integers(0, w)), int(rng.integers(0, h))] for _ in range(count)]
+
+
+def scratch_copy(fixture_path, scratch_path):
+    """
+    A dataset sharing the fixture's images but with its own annotations.json,
+    so annotations, sessions and exports a run writes never reach the fixture
+    and every run measures the dataset as it was generated.
+    """
+    if scratch_path.exists():
+        shutil.rmtree(scratch_path)
+    scratch_path.mkdir(parents=True)
+    (scratch_path / "images").symlink_to((fixture_path / "images").resolve())
+    shutil.copy(fixture_path / "annotations.json", scratch_path / "annotations.json")
+    return scratch_path
+
+
+def run_size(size_name, params, workdir, repeats, sam_factory):
+    fixture_path = Path(workdir) / size_name
+    if not (fixture_path / "annotations.json").exists():
+        make_dataset(fixture_path, **params)
+    dataset_path = scratch_copy(fixture_path, Path(workdir) / f"{size_name}.run")
+    try:
+        return run_benchmarks(dataset_path, repeats, sam_factory)
+    finally:
+        shutil.rmtree(dataset_path)
+
+
+def run_benchmarks(dataset_path, repeats, sam_factory):
+    results = {}
+    rng = np.random.default_rng(0)
+
+    editors = []
+    results["startup"] = measure(
+        lambda: editors.append(new_editor(dataset_path, None)),
+        repeats,
+        setup=lambda: close_editors(editors),
+    )
+    results["startup_with_model"] = measure(
+        lambda: editors.append(new_editor(dataset_path, sam_factory())),
+        repeats,
+        setup=lambda: close_editors(editors),
+    )
+    close_editors(editors)
+
+    editor = new_editor(dataset_path, sam_factory())
+    wait_for_workers(editor)
+    num_images = editor.dataset_explorer.get_num_images()
+    steps = min(num_images - 1, repeats)
+    results["navigate_next"] = measure(editor.next_image, steps)
+    results["navigate_prev_cached"] = measure(editor.prev_image, steps)
+
+    # time to first display when a reduced proxy is shown while the full frame
+    # decodes; left out for sizes too small to get a proxy
+    proxy_editor = new_editor(dataset_path, None)
+    if proxy_editor.dataset_explorer.get_display_proxy(0) is not None:
+        wait_for_workers(proxy_editor)
+        proxy_editor.on_image_loaded = lambda image_id: None
+        results["navigate_next_proxy"] = measure(proxy_editor.next_image, steps)
+    close_editors([proxy_editor])
+
+    editor.goto_image(0)
+    points = click_points(editor, rng, repeats)
+    clicks = iter(points)
+    results["click_to_render"] = measure(
+        lambda: editor.add_click(next(clicks), 1), repeats, setup=editor.reset
+    )
+    results["redraw_annotations_cached"] = measure(
+        lambda: editor.draw_selected_annotations([]), repeats
+    )
+
+    def clear_mask_cache():
+        editor.du.mask_cache.clear()
+        editor.du.mask_cache_used = 0
+
+    results["redraw_annotations_cold"] = measure(
+        lambda: editor.draw_selected_annotations([]), repeats, setup=clear_mask_cache
+    )
+
+    def add_annotation():
+        editor.add_click(click_points(editor, rng, 1)[0], 1)
+        editor.save_ann()
+
+    results["add_annotation"] = measure(add_annotation, repeats, setup=editor.reset)
+    results["save"] = measure(editor.save, max(1, repeats // 5))
+
+    export_path = dataset_path / "export"
+    json_path = dataset_path / "annotations.json"
+    results["export_full"] = measure(
+        lambda: export_dataset(json_path, export_path, incremental=False),
+        max(1, repeats // 10),
+    )
+    results["export_incremental"] = measure(
+        lambda: export_dataset(json_path, export_path), max(1, repeats // 10)
+    )
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(sizes, output, workdir, repeats, backend):
+    sam_factory = {"fake": FakeSam, "fake-onnx": fake_onnx_sam}[backend]
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": backend,
+        "results": {},
+    }
+    for size_name in sizes:
+        params = SIZES[size_name]
+        print(f"== {size_name}: {params}")
+        results = run_size(size_name, params, workdir, repeats, sam_factory)
+        for name, stats in results.items():
+            print(f"{name:<28} p50 {stats['p50_ms']:9.2f} ms   p90 {stats['p90_ms']:9.2f} ms")
+        report["results"][size_name] = {
+            "params": {k: list(v) if isinstance(v, tuple) else v for k, v in params.items()},
+            "benchmarks": results,
+        }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"wrote {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=str, default="small,medium")
+    parser.add_argument("--output", type=str, default="bench_results.json")
+    parser.add_argument(
+        "--workdir",
+        type=str,
+        default=None,
+        help="where synthetic datasets are generated and reused between runs",
+    )
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--backend", choices=["fake", "fake-onnx"], default="fake")
+    args = parser.parse_args()
+
+    sizes = args.sizes.split(",")
+    if args.workdir is None:
+        with tempfile.TemporaryDirectory() as workdir:
+            main(sizes, args.output, workdir, args.repeats, args.backend)
+    else:
+        Path(args.workdir).mkdir(parents=True, exist_ok=True)
+        main(sizes, args.output, args.workdir, args.repeats, args.backend)
@@ -0,0 +1,98 @@
+"""
+Generates SALT datasets of a given size: images, annotations per image and
+resolution. Only a handful of distinct images are encoded, the rest are hard
+links to them, so datasets with 100k images are cheap to create.
+"""
+import json
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from salt.dataset_explorer import parse_mask_to_coco
+
+NUM_UNIQUE_IMAGES = 8
+
+
+def random_image(rng, height, width):
+    image = rng.integers(0, 255, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    image = cv2.resize(image, (width, height), interpolation=cv2.INTER_LINEAR)
+    for _ in range(10):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(10, width // 4)), int(rng.integers(10, height // 4)))
+        color = tuple(int(c) for c in rng.integers(0, 255, size=3))
+        cv2.ellipse(image, center, axes, float(rng.integers(0, 180)), 0, 360, color, -1)
+    return image
+
+
+def random_masks(rng, height, width, count, max_object_frac=0.2):
+    masks = []
+    for _ in range(count):
+        mask = np.zeros((height, width), dtype=np.uint8)
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (
+            int(rng.integers(2, max(3, width * max_object_frac / 2))),
+            int(rng.integers(2, max(3, height * max_object_frac / 2))),
+        )
+        cv2.ellipse(mask, center, axes, float(rng.integers(0, 180)), 0, 360, 1, -1)
+        masks.append(mask)
+    return masks
+
+
+def make_dataset(
+    dataset_path,
+    num_images,
+    resolution=(1500, 2250),
+    annotations_per_image=10,
+    annotated_fraction=1.0,
+    categories=("cat_a", "cat_b", "cat_c"),
+    seed=0,
+):
+    """
+    Writes <dataset_path>/images/*.jpg and <dataset_path>/annotations.json.
+    The first annotated_fraction of the images carry annotations_per_image
+    annotations each. Returns the dataset path.
+    """
+    rng = np.random.default_rng(seed)
+    dataset_path = Path(dataset_path)
+    images_path = dataset_path / "images"
+    images_path.mkdir(parents=True, exist_ok=True)
+    height, width = resolution
+
+    unique_paths = []
+    for i in range(min(NUM_UNIQUE_IMAGES, num_images)):
+        path = images_path / f"{i:07d}.jpg"
+        cv2.imwrite(str(path), random_image(rng, height, width))
+        unique_paths.append(path)
+    for i in range(len(unique_paths), num_images):
+        path = images_path / f"{i:07d}.jpg"
+        if not path.exists():
+            os.link(unique_paths[i % len(unique_paths)], path)
+
+    # annotations are encoded once per distinct mask set and reused with new ids
+    unique_annotations = [
+        [
+            parse_mask_to_coco(0, 0, mask, int(rng.integers(0, len(categories))))
+            for mask in random_masks(rng, height, width, annotations_per_image)
+        ]
+        for _ in range(NUM_UNIQUE_IMAGES)
+    ]
+    num_annotated = int(num_images * annotated_fraction)
+    dataset = {"categories": list(categories), "images": {}}
+    annotation_id = 0
+    for i in range(num_images):
+        annotations = []
+        if i < num_annotated:
+            for template in unique_annotations[i % NUM_UNIQUE_IMAGES]:
+                annotation = dict(template, id=annotation_id, image_id=i)
+                annotations.append(annotation)
+                annotation_id += 1
+        dataset["images"][os.path.join("images", f"{i:07d}.jpg")] = {
+            "width": width,
+            "height": height,
+            "annotations": annotations,
+        }
+    with open(dataset_path / "annotations.json", "w") as f:
+        json.dump(dataset, f)
+    return dataset_path
@@ -0,0 +1,31 @@
+import argparse
+import time
+from pathlib import Path
+
+from salt.export import FORMATS, export_dataset
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-path", type=str, default="./dataset")
+    parser.add_argument("--output-path", type=str, default=None)
+    parser.add_argument("--formats", type=str, default=",".join(FORMATS))
+    parser.add_argument("--epsilon", type=float, default=1.0, help="polygon simplification in pixels")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--full", action="store_true", help="re-export unchanged images too")
+    args = parser.parse_args()
+
+    dataset_path = Path(args.dataset_path)
+    output_path = args.output_path
+    if output_path is None:
+        output_path = dataset_path / "export"
+
+    start = time.perf_counter()
+    num_exported = export_dataset(
+        dataset_path / "annotations.json",
+        output_path,
+        formats=args.formats.split(","),
+        epsilon=args.epsilon,
+        workers=args.workers,
+        incremental=not args.full,
+    )
+    print(f"exported {num_exported} images to {output_path} in {time.perf_counter() - start:.1f}s")
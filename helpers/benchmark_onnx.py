@@ -0,0 +1,96 @@
+# Compares the torch SamPredictor against the ONNX Runtime encoder/decoder on CPU.
+# Run after generate_onnx.py --encoder has written the models.
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from segment_anything_hq import SamPredictor, sam_model_registry
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from salt.onnx_model import OnnxSam  # noqa: E402
+
+
+def time_calls(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def report(name, timings):
+    print(
+        f"{name:<24} mean {timings.mean():9.1f} ms   "
+        f"p50 {np.percentile(timings, 50):9.1f} ms   "
+        f"p90 {np.percentile(timings, 90):9.1f} ms"
+    )
+
+
+def main(checkpoint_path, model_type, onnx_models_path, images_folder, num_images, repeats):
+    image_paths = sorted(
+        path
+        for path in images_folder.iterdir()
+        if path.suffix.lower() in [".jpg", ".png"]
+    )[:num_images]
+    images = [
+        cv2.cvtColor(cv2.imread(str(path)), cv2.COLOR_BGR2RGB) for path in image_paths
+    ]
+
+    sam = sam_model_registry[model_type](checkpoint=checkpoint_path)
+    sam.to(device="cpu")
+    torch_predictor = SamPredictor(sam)
+    predictors = {"torch": torch_predictor}
+    for quantized in (False, True):
+        try:
+            onnx_sam = OnnxSam(onnx_models_path, quantized=quantized)
+        except Exception as e:
+            print(f"skipping onnx (quantized={quantized}): {e}")
+            continue
+        if onnx_sam.encoder.quantized != quantized:
+            print("skipping onnx (quantized=True): no sam_encoder.quant.onnx")
+            continue
+        predictors[f"onnx{'-int8' if quantized else ''}"] = onnx_sam.create_predictor()
+
+    for name, predictor in predictors.items():
+        encode_timings, decode_timings = [], []
+        for image in images:
+            encode_timings.append(time_calls(lambda: predictor.set_image(image), 1))
+            h, w = image.shape[:2]
+            point_coords = np.array([[w // 2, h // 2]])
+            point_labels = np.array([1])
+            decode_timings.append(
+                time_calls(
+                    lambda: predictor.predict(
+                        point_coords=point_coords,
+                        point_labels=point_labels,
+                        multimask_output=False,
+                    ),
+                    repeats,
+                )
+            )
+        report(f"{name} encode", np.concatenate(encode_timings))
+        report(f"{name} decode", np.concatenate(decode_timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint-path", type=str, default="./sam_hq_vit_h.pth")
+    parser.add_argument("--model_type", type=str, default="vit_h")
+    parser.add_argument("--onnx-models-path", type=str, default="./models")
+    parser.add_argument("--dataset-path", type=str, default="./dataset")
+    parser.add_argument("--num-images", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    main(
+        args.checkpoint_path,
+        args.model_type,
+        args.onnx_models_path,
+        Path(args.dataset_path) / "images",
+        args.num_images,
+        args.repeats,
+    )
@@ -9,16 +9,133 @@ import shutil
 import warnings
 
 import torch
+import torch.nn.functional as F
 from onnxruntime.quantization import QuantType
 from onnxruntime.quantization.quantize import quantize_dynamic
 from segment_anything_hq import sam_model_registry
 from segment_anything_hq.utils.onnx import SamOnnxModel
 
 
-def save_onnx_model(checkpoint, model_type, onnx_model_path, orig_im_size, opset_version, quantize = True):
+class SamEncoderOnnxModel(torch.nn.Module):
+    """
+    Wraps the HQ image encoder so the exported graph takes an RGB image already
+    resized to a longest side of 1024 (H, W, 3) and returns the image embeddings
+    together with the stacked intermediate ViT embeddings used by the HQ decoder.
+    """
+
+    def __init__(self, sam):
+        super().__init__()
+        self.image_encoder = sam.image_encoder
+        self.img_size = sam.image_encoder.img_size
+        self.register_buffer("pixel_mean", sam.pixel_mean)
+        self.register_buffer("pixel_std", sam.pixel_std)
+
+    def forward(self, input_image):
+        x = input_image.permute(2, 0, 1)[None, :, :, :]
+        x = (x - self.pixel_mean) / self.pixel_std
+        h, w = x.shape[-2:]
+        x = F.pad(x, (0, self.img_size - w, 0, self.img_size - h))
+        image_embeddings, interm_embeddings = self.image_encoder(x)
+        return image_embeddings, torch.stack(interm_embeddings)
+
+
+class SamMultimaskOnnxModel(SamOnnxModel):
+    """
+    SamOnnxModel whose multimask output keeps all three candidates, each
+    refined by the HQ mask. The upstream wrapper returns only the best one.
+    """
+
+    @torch.no_grad()
+    def forward(
+        self,
+        image_embeddings,
+        interm_embeddings,
+        point_coords,
+        point_labels,
+        mask_input,
+        has_mask_input,
+        orig_im_size,
+    ):
+        sparse_embedding = self._embed_points(point_coords, point_labels)
+        dense_embedding = self._embed_masks(mask_input, has_mask_input)
+
+        decoder = self.model.mask_decoder
+        vit_features = interm_embeddings[0].permute(0, 3, 1, 2)
+        hq_features = decoder.embedding_encoder(image_embeddings) + decoder.compress_vit_feat(vit_features)
+        masks, scores = decoder.predict_masks(
+            image_embeddings=image_embeddings,
+            image_pe=self.model.prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse_embedding,
+            dense_prompt_embeddings=dense_embedding,
+            hq_features=hq_features,
+        )
+        # tokens 1-3 are the SAM candidates, the last one is the HQ token
+        hq_token = decoder.num_mask_tokens - 1
+        masks = masks[:, 1:hq_token] + masks[:, hq_token : hq_token + 1]
+        scores = scores[:, 1:hq_token]
+
+        upscaled_masks = self.mask_postprocessing(masks, orig_im_size)
+        return upscaled_masks, scores, masks
+
+
+def quantize_onnx_model(onnx_model_path, use_external_data_format=False):
+    temp_model_path = os.path.join(os.path.split(onnx_model_path)[0], "temp.onnx")
+    shutil.copy(onnx_model_path, temp_model_path)
+    quantize_dynamic(
+        model_input=temp_model_path,
+        model_output=onnx_model_path,
+        optimize_model=True,
+        per_channel=False,
+        reduce_range=False,
+        weight_type=QuantType.QUInt8,
+        use_external_data_format=use_external_data_format,
+    )
+    os.remove(temp_model_path)
+
+
+def save_onnx_encoder(checkpoint, model_type, onnx_model_path, opset_version, quantize=True):
     sam = sam_model_registry[model_type](checkpoint=checkpoint)
 
-    onnx_model = SamOnnxModel(sam, multimask_output=False)  # , return_single_mask=True)
+    onnx_model = SamEncoderOnnxModel(sam)
+    dummy_inputs = {
+        "input_image": torch.randint(
+            low=0, high=255, size=(683, 1024, 3), dtype=torch.float
+        ),
+    }
+    dynamic_axes = {
+        "input_image": {0: "image_height", 1: "image_width"},
+    }
+    output_names = ["image_embeddings", "interm_embeddings"]
+
+    # ViT-H weights exceed the 2GB protobuf limit, so the export is written to a
+    # path and torch places the weights next to it as external data.
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=torch.jit.TracerWarning)
+        warnings.filterwarnings("ignore", category=UserWarning)
+        torch.onnx.export(
+            onnx_model,
+            tuple(dummy_inputs.values()),
+            onnx_model_path,
+            export_params=True,
+            verbose=False,
+            opset_version=opset_version,
+            do_constant_folding=True,
+            input_names=list(dummy_inputs.keys()),
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+        )
+
+    if quantize:
+        quantize_onnx_model(onnx_model_path, use_external_data_format=True)
+
+
+def save_onnx_model(checkpoint, model_type, onnx_model_path, orig_im_size, opset_version, quantize = True, multimask_output=False):
+    sam = sam_model_registry[model_type](checkpoint=checkpoint)
+
+    if multimask_output:
+        onnx_model = SamMultimaskOnnxModel(sam)
+    else:
+        onnx_model = SamOnnxModel(sam)
 
     dynamic_axes = {
         "point_coords": {1: "num_points"},
@@ -60,19 +177,9 @@ def save_onnx_model(checkpoint, model_type, onnx_model_path, orig_im_size, opset
             )
 
     if quantize:
-        temp_model_path = os.path.join(os.path.split(onnx_model_path)[0], "temp.onnx")
-        shutil.copy(onnx_model_path, temp_model_path)
-        quantize_dynamic(
-            model_input=temp_model_path,
-            model_output=onnx_model_path,
-            optimize_model=True,
-            per_channel=False,
-            reduce_range=False,
-            weight_type=QuantType.QUInt8,
-        )
-        os.remove(temp_model_path)
+        quantize_onnx_model(onnx_model_path)
 
-def main(checkpoint_path, model_type, onnx_models_path, dataset_path, opset_version, quantize):
+def main(checkpoint_path, model_type, onnx_models_path, dataset_path, opset_version, quantize, export_encoder, export_multimask):
     if not os.path.exists(onnx_models_path):
         os.makedirs(onnx_models_path)
 
@@ -80,6 +187,16 @@ def main(checkpoint_path, model_type, onnx_models_path, dataset_path, opset_vers
     onnx_model_path = os.path.join(onnx_models_path, f"sam_onnx.{orig_im_size[0]}_{orig_im_size[1]}.onnx")
     save_onnx_model(checkpoint_path, model_type, onnx_model_path, orig_im_size, opset_version, quantize)
 
+    if export_multimask:
+        # used for single-click prompts, which are ambiguous
+        multimask_model_path = os.path.join(onnx_models_path, f"sam_onnx_multimask.{orig_im_size[0]}_{orig_im_size[1]}.onnx")
+        save_onnx_model(checkpoint_path, model_type, multimask_model_path, orig_im_size, opset_version, quantize, multimask_output=True)
+
+    if export_encoder:
+        encoder_name = "sam_encoder.quant.onnx" if quantize else "sam_encoder.onnx"
+        encoder_model_path = os.path.join(onnx_models_path, encoder_name)
+        save_onnx_encoder(checkpoint_path, model_type, encoder_model_path, opset_version, quantize)
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -89,6 +206,8 @@ if __name__ == "__main__":
     parser.add_argument("--dataset-path", type=str, default="./dataset")
     parser.add_argument("--opset-version", type=int, default=15)
     parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--encoder", action="store_true", help="also export the image encoder")
+    parser.add_argument("--multimask", action="store_true", help="also export a decoder returning 3 candidate masks")
     args = parser.parse_args()
 
     checkpoint_path = args.checkpoint_path
@@ -97,5 +216,7 @@ if __name__ == "__main__":
     dataset_path = args.dataset_path
     opset_version = args.opset_version
     quantize = args.quantize
+    export_encoder = args.encoder
+    export_multimask = args.multimask
 
-    main(checkpoint_path, model_type, onnx_models_path, dataset_path, opset_version, quantize)
+    main(checkpoint_path, model_type, onnx_models_path, dataset_path, opset_version, quantize, export_encoder, export_multimask)
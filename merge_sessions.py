@@ -0,0 +1,16 @@
+import argparse
+from pathlib import Path
+
+from salt.sessions import merge_sessions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-path", type=str, default="./dataset")
+    parser.add_argument("--delete-shards", action="store_true", help="delete instead of archiving merged shards")
+    args = parser.parse_args()
+
+    dataset_path = Path(args.dataset_path)
+    num_images, num_renumbered = merge_sessions(
+        dataset_path, dataset_path / "annotations.json", archive=not args.delete_shards
+    )
+    print(f"merged {num_images} images into {dataset_path / 'annotations.json'}, renumbered {num_renumbered} ids")
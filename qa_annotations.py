@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from salt.qa import DEFAULT_THRESHOLDS, apply_fixes, run_qa
+from salt.sessions import atomic_write_json, dataset_lock, unmerged_shards
+
+
+def refuse_unmerged_shards(dataset_path):
+    # fixes written now would be overwritten by the sessions' edits on the next merge
+    shards = unmerged_shards(dataset_path)
+    if shards:
+        raise SystemExit(
+            f"{len(shards)} session shards are not merged yet, run merge_sessions.py "
+            "before --fix"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-path", type=str, default="./dataset")
+    parser.add_argument("--report-path", type=str, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    for name, value in DEFAULT_THRESHOLDS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=value)
+    parser.add_argument("--fix", action="store_true", help="remove empty masks and merge duplicates")
+    parser.add_argument("--fix-tiny", action="store_true", help="with --fix, also remove tiny masks")
+    args = parser.parse_args()
+
+    dataset_path = Path(args.dataset_path)
+    dataset_json_path = dataset_path / "annotations.json"
+    report_path = args.report_path
+    if report_path is None:
+        report_path = dataset_path / "qa_report.json"
+
+    if args.fix:
+        refuse_unmerged_shards(dataset_path)
+    read_mtime = os.stat(dataset_json_path).st_mtime_ns
+    with open(dataset_json_path, "r") as f:
+        dataset = json.load(f)
+
+    start = time.perf_counter()
+    thresholds = {name: getattr(args, name) for name in DEFAULT_THRESHOLDS}
+    report = run_qa(dataset, thresholds=thresholds, workers=args.workers)
+    print(
+        f"checked {report['num_annotations']} annotations on {report['num_images']} images "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    for kind, count in sorted(report["summary"].items()):
+        print(f"  {kind:<20}{count}")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"report written to {report_path}")
+
+    if args.fix:
+        num_removed = apply_fixes(dataset, report, remove_tiny=args.fix_tiny)
+        with dataset_lock(dataset_path):
+            refuse_unmerged_shards(dataset_path)
+            if os.stat(dataset_json_path).st_mtime_ns != read_mtime:
+                raise SystemExit("annotations.json changed during the check, run again")
+            shutil.copy(dataset_json_path, dataset_json_path.with_suffix(".json.bak"))
+            atomic_write_json(dataset_json_path, dataset, indent=4)
+        print(f"removed {num_removed} annotations, backup at {dataset_json_path.with_suffix('.json.bak')}")
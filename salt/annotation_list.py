@@ -0,0 +1,76 @@
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+
+
+class AnnotationListModel(QAbstractListModel):
+    """
+    The annotations of the current image, as listed by Editor.list_annotations.
+    sync() turns edits into row insertions and removals, so the view keeps its
+    selection and scroll position and only touches the rows that changed.
+    The annotation id of a row is its Qt.UserRole data.
+    """
+
+    def __init__(self, editor):
+        super(AnnotationListModel, self).__init__()
+        self.editor = editor
+        self.image_id = None
+        self.rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        annotation_id, category_id = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{annotation_id} - {self.editor.categories[category_id]}"
+        if role == Qt.UserRole:
+            return annotation_id
+        return None
+
+    def sync(self):
+        anns, _ = self.editor.list_annotations()
+        rows = [(ann["id"], ann["category_id"]) for ann in anns]
+        if self.image_id != self.editor.image_id:
+            self.beginResetModel()
+            self.image_id = self.editor.image_id
+            self.rows = rows
+            self.endResetModel()
+            return
+
+        # annotations keep their relative order, so removing the ids that are
+        # gone and inserting the new ones at their place turns one list into the other
+        new_ids = {annotation_id for annotation_id, _ in rows}
+        row = len(self.rows) - 1
+        while row >= 0:
+            if self.rows[row][0] in new_ids:
+                row -= 1
+                continue
+            last = row
+            while row >= 0 and self.rows[row][0] not in new_ids:
+                row -= 1
+            self.beginRemoveRows(QModelIndex(), row + 1, last)
+            del self.rows[row + 1 : last + 1]
+            self.endRemoveRows()
+
+        old_ids = {annotation_id for annotation_id, _ in self.rows}
+        row = 0
+        while row < len(rows):
+            if rows[row][0] in old_ids:
+                row += 1
+                continue
+            first = row
+            while row < len(rows) and rows[row][0] not in old_ids:
+                row += 1
+            self.beginInsertRows(QModelIndex(), first, row - 1)
+            self.rows[first:first] = rows[first:row]
+            self.endInsertRows()
+
+        for row, (old, new) in enumerate(zip(self.rows, rows)):
+            if old != new:
+                # re-categorized
+                self.rows[row] = new
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
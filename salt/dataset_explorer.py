@@ -1,6 +1,7 @@
-import copy
 import itertools
 import json
+import os
+import time
 from pathlib import Path
 
 import cv2
@@ -9,6 +10,11 @@ from distinctipy import distinctipy
 from PIL import Image
 from pycocotools import mask as mask_utils
 
+from salt.image_loader import REDUCED_FLAGS, ImageLoader, reduce_factor_for
+from salt.profiling import profiler
+from salt.rle import RoiMask
+from salt.sessions import SessionStore, atomic_write_json, max_annotation_id
+
 
 def init_dataset(dataset_folder, image_paths, categories, dataset_json_path):
     dataset_json = {
@@ -39,8 +45,11 @@ def unbunch_coords(coords):
 
 def parse_mask_to_coco(image_id, anno_id, image_mask, category_id):
     start_anno_id = anno_id
-    fortran_binary_mask = np.asfortranarray(image_mask)
-    encoded_mask = mask_utils.encode(fortran_binary_mask)
+    if isinstance(image_mask, RoiMask):
+        encoded_mask = image_mask.to_rle()
+    else:
+        fortran_binary_mask = np.asfortranarray(image_mask)
+        encoded_mask = mask_utils.encode(fortran_binary_mask)
     x, y, width, height = mask_utils.toBbox(encoded_mask)
     annotation = {
         "id": start_anno_id,
@@ -58,13 +67,15 @@ def parse_mask_to_coco(image_id, anno_id, image_mask, category_id):
 
 
 class DatasetExplorer:
-    def __init__(self, dataset_folder, categories=None, dataset_json_path=None):
+    def __init__(self, dataset_folder, categories=None, dataset_json_path=None, session=None):
         self.dataset_folder = Path(dataset_folder)
-        self.image_paths = [
-            str(image.relative_to(self.dataset_folder))
-            for image in (self.dataset_folder / "images").iterdir()
-            if image.suffix in (".jpg", ".png")
-        ]
+        # scandir avoids building a Path per file, which matters on 100k+ images
+        with os.scandir(self.dataset_folder / "images") as entries:
+            self.image_paths = [
+                os.path.join("images", entry.name)
+                for entry in entries
+                if os.path.splitext(entry.name)[1] in (".jpg", ".png")
+            ]
         self.dataset_json_path = Path(dataset_json_path)
         if not self.dataset_json_path.exists():
             self.__init_dataset_json(categories)
@@ -72,9 +83,21 @@ class DatasetExplorer:
             self.dataset = json.load(f)
 
         self.categories = self.dataset["categories"]
-        self.global_annotation_id = 0
-        for image_info in self.dataset["images"].values():
-            self.global_annotation_id += len(image_info["annotations"])
+
+        # with a session, edits of all sessions are overlaid on the canonical
+        # file and this session writes only the images it touched
+        self.session = None
+        self.edited = {}
+        self.lease_renewed = {}
+        if session is not None:
+            self.session = SessionStore(self.dataset_folder, session)
+            for image_name, (updated, annotations) in self.session.read_shards().items():
+                self.dataset["images"][image_name]["annotations"] = annotations
+            self.edited = self.session.edited_images()
+        self.global_annotation_id = max_annotation_id(self.dataset["images"]) + 1
+
+        self.image_loader = None
+        self.image_ids = None
 
         self.category_colors = distinctipy.get_colors(len(self.categories), rng=len(self.categories))
         self.category_colors = [
@@ -99,13 +122,39 @@ class DatasetExplorer:
     def get_num_images(self):
         return len(self.image_paths)
 
+    def get_image_id(self, image_name):
+        if self.image_ids is None:
+            self.image_ids = {name: image_id for image_id, name in enumerate(self.image_paths)}
+        return self.image_ids[image_name]
+
+    def get_image_size(self, image_id):
+        image_info = self.dataset["images"][self.image_paths[image_id]]
+        return image_info["height"], image_info["width"]
+
     def get_image_data(self, image_id):
-        image_name = self.image_paths[image_id]
-        image_path = self.dataset_folder / image_name
-        image = cv2.imread(str(image_path))
-        image_bgr = copy.deepcopy(image)
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        return image, image_bgr
+        """
+        The full resolution BGR frame, decoded in a worker process.
+        """
+        if self.image_loader is None:
+            self.image_loader = ImageLoader()
+        image_path = self.dataset_folder / self.image_paths[image_id]
+        return self.image_loader.load(image_path, self.get_image_size(image_id))
+
+    @profiler.timed("dataset.load_proxy")
+    def get_display_proxy(self, image_id, max_side=2048):
+        """
+        A downscaled BGR frame for display while the full one decodes, and the
+        factor it was reduced by, or None if the image is small enough to not need one.
+        """
+        height, width = self.get_image_size(image_id)
+        factor = reduce_factor_for(height, width, max_side)
+        if factor == 1:
+            return None
+        image_path = self.dataset_folder / self.image_paths[image_id]
+        proxy = cv2.imread(str(image_path), REDUCED_FLAGS[factor])
+        if proxy is None:
+            return None
+        return proxy, width / proxy.shape[1]
 
     # def __add_to_our_annotation_dict(self, annotation):
     #     image_id = annotation["image_id"]
@@ -126,18 +175,162 @@ class DatasetExplorer:
         return annotations
 
     def delete_annotations(self, image_id, annotation_id):
+        holder = self.__mark_edited(image_id)
+        if holder is not None:
+            return holder
+        image_name = self.image_paths[image_id]
+        image_info = self.dataset["images"][image_name]
+        image_info["annotations"] = [
+            a for a in image_info["annotations"] if a["id"] != annotation_id
+        ]
+        return None
+
+    def set_annotation_category(self, image_id, annotation_id, category_id):
+        holder = self.__mark_edited(image_id)
+        if holder is not None:
+            return holder
+        for annotation in self.get_annotations(image_id):
+            if annotation["id"] == annotation_id:
+                annotation["category_id"] = category_id
+        return None
+
+    def set_annotation_mask(self, image_id, annotation_id, mask):
+        """
+        Replaces the segmentation of an annotation with a RoiMask, encoding only its crop.
+        """
+        holder = self.__mark_edited(image_id)
+        if holder is not None:
+            return holder
+        updated = parse_mask_to_coco(image_id, annotation_id, mask, 0)
+        for annotation in self.get_annotations(image_id):
+            if annotation["id"] == annotation_id:
+                for key in ("bbox", "area", "segmentation"):
+                    annotation[key] = updated[key]
+        return None
+
+    def __query_matcher(self, token):
+        key, _, value = token.partition(":")
+        if key in ("cat", "category") and value:
+            if value not in self.categories:
+                raise ValueError(f"Unknown category: {value}")
+            category_id = self.categories.index(value)
+            return lambda name, anns: any(a["category_id"] == category_id for a in anns)
+        if token == "empty":
+            return lambda name, anns: not anns
+        if token == "annotated":
+            return lambda name, anns: bool(anns)
+        return lambda name, anns: token in name
+
+    def find_image(self, query, start=0):
+        """
+        Returns the id of the first image after start matching every token of
+        the query, wrapping around, or None. Tokens are cat:<name>, empty,
+        annotated, or a substring of the image path.
+        """
+        matchers = [self.__query_matcher(token) for token in query.split()]
+        if not matchers:
+            return None
+        num_images = self.get_num_images()
+        for offset in range(1, num_images + 1):
+            image_id = (start + offset) % num_images
+            image_name = self.image_paths[image_id]
+            annotations = self.dataset["images"][image_name]["annotations"]
+            if all(match(image_name, annotations) for match in matchers):
+                return image_id
+        return None
+
+    def __next_annotation_id(self):
+        if self.session is not None:
+            return self.session.allocate_id(self.dataset["images"])
+        annotation_id = self.global_annotation_id
+        self.global_annotation_id += 1
+        return annotation_id
+
+    def __mark_edited(self, image_id):
+        """
+        Takes the image for an edit. Returns the session holding it if another
+        one does, in which case the edit must not be made, else None.
+        """
+        if self.session is None:
+            return None
         image_name = self.image_paths[image_id]
-        self.dataset["images"][image_name]["annotations"].pop(annotation_id)
+        # held until the shard is merged, so nobody else edits it meanwhile.
+        # acquired on every edit: an idle lease may have expired and been taken
+        holder = self.session.acquire(image_name, keep=True)
+        if holder is not None:
+            return holder
+        self.edited[image_name] = time.time()
+        self.lease_renewed[image_name] = time.time()
+        return None
+
+    def claim_image(self, image_id, previous_image_id=None):
+        """
+        Leases the image for this session, releasing the previous one unless it
+        was edited. Returns the session holding it if it is taken, else None.
+        """
+        if self.session is None:
+            return None
+        if previous_image_id is not None:
+            previous_name = self.image_paths[previous_image_id]
+            if previous_name not in self.edited:
+                self.session.release(previous_name)
+        image_name = self.image_paths[image_id]
+        self.lease_renewed[image_name] = time.time()
+        return self.session.acquire(image_name, keep=image_name in self.edited)
+
+    def renew_claim(self, image_id):
+        """
+        Renews the lease on the image being worked on before it can expire.
+        Returns the session holding it if another one took it, else None.
+        """
+        if self.session is None:
+            return None
+        image_name = self.image_paths[image_id]
+        if time.time() - self.lease_renewed.get(image_name, 0) < self.session.lease_ttl / 3:
+            return None
+        self.lease_renewed[image_name] = time.time()
+        return self.session.acquire(image_name, keep=image_name in self.edited)
+
+    def is_available(self, image_id):
+        if self.session is None:
+            return True
+        holder = self.session.lease_holder(self.image_paths[image_id])
+        return holder is None or holder == self.session.session
+
+    def next_available_image(self, image_id, step=1):
+        """
+        The next image in the given direction not leased by another session, or None.
+        """
+        image_id += step
+        while 0 <= image_id < self.get_num_images():
+            if self.is_available(image_id):
+                return image_id
+            image_id += step
+        return None
 
     def add_annotation(self, image_id, category_id, mask):
         if mask is None:
-            return
-        annotation = parse_mask_to_coco(image_id, self.global_annotation_id, mask, category_id)
+            return None
+        holder = self.__mark_edited(image_id)
+        if holder is not None:
+            return holder
+        annotation = parse_mask_to_coco(image_id, self.__next_annotation_id(), mask, category_id)
         # self.__add_to_our_annotation_dict(annotation)
         image_name = self.image_paths[image_id]
         self.dataset["images"][image_name]["annotations"].append(annotation)
-        self.global_annotation_id += 1
+        return None
 
+    @profiler.timed("dataset.save")
     def save_annotation(self):
-        with open(self.dataset_json_path, "w") as f:
-            json.dump(self.dataset, f, indent=4)
+        if self.session is not None:
+            merged = self.session.write_shard(
+                {
+                    image_name: self.dataset["images"][image_name]["annotations"]
+                    for image_name in self.edited
+                },
+                self.edited,
+            )
+            for image_name in merged:
+                del self.edited[image_name]
+            return
+        atomic_write_json(self.dataset_json_path, self.dataset, indent=4)
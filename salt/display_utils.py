@@ -1,12 +1,20 @@
+from collections import OrderedDict
+
 import cv2
 import numpy as np
-from pycocotools import mask as mask_utils
+
+from salt.profiling import profiler
+from salt.rle import RoiMask
 
 
 class DisplayUtils:
-    def __init__(self):
+    def __init__(self, mask_cache_bytes=512 * 2**20):
         self.transparency = 0.2
         self.box_width = 2
+        # decoded annotation masks as RoiMasks, so redraws don't decode RLE again
+        self.mask_cache = OrderedDict()
+        self.mask_cache_bytes = mask_cache_bytes
+        self.mask_cache_used = 0
 
     def increase_transparency(self):
         self.transparency = min(1.0, self.transparency + 0.05)
@@ -14,6 +22,7 @@ class DisplayUtils:
     def decrease_transparency(self):
         self.transparency = max(0.0, self.transparency - 0.05)
 
+    @profiler.timed("display.overlay_mask")
     def overlay_mask_on_image(self, image, mask, color=(255, 0, 0)):
         gray_mask = mask.astype(np.uint8) * 255
         gray_mask = cv2.merge([gray_mask, gray_mask, gray_mask])
@@ -26,17 +35,59 @@ class DisplayUtils:
         image = cv2.add(background, overlay_on_masked_image)
         return image
 
-    def __convert_ann_to_mask(self, ann, height, width):
-        mask = np.zeros((height, width), dtype=np.uint8)
-        mask_instance = mask_utils.decode(ann["segmentation"])
-        mask_instance = np.logical_not(mask_instance)
-        mask = np.logical_or(mask, mask_instance)
-        mask = np.logical_not(mask)
+    def overlay_roi_mask_on_image(self, image, roi_mask, color=(255, 0, 0)):
+        # blends only the crop, in place
+        h, w = roi_mask.crop.shape
+        if h == 0 or w == 0:
+            return image
+        y0, x0 = roi_mask.y0, roi_mask.x0
+        region = image[y0 : y0 + h, x0 : x0 + w]
+        image[y0 : y0 + h, x0 : x0 + w] = self.overlay_mask_on_image(
+            region, roi_mask.crop, color
+        )
+        return image
+
+    def __convert_ann_to_mask(self, ann):
+        # the counts string changes whenever the mask does, so it keys edits too
+        key = (ann["id"], ann["segmentation"]["counts"])
+        mask = self.mask_cache.get(key)
+        if mask is not None:
+            self.mask_cache.move_to_end(key)
+            return mask
+        # decodes only the object's bounding box, not the frame
+        return self.cache_mask(ann, RoiMask.from_rle(ann["segmentation"]))
+
+    def cache_mask(self, ann, mask):
+        """
+        Caches mask as the decoded segmentation of ann, e.g. right after an edit.
+        """
+        key = (ann["id"], ann["segmentation"]["counts"])
+        self.mask_cache[key] = mask
+        self.mask_cache_used += mask.crop.nbytes
+        while self.mask_cache_used > self.mask_cache_bytes and len(self.mask_cache) > 1:
+            _, evicted = self.mask_cache.popitem(last=False)
+            self.mask_cache_used -= evicted.crop.nbytes
         return mask
 
-    def draw_box_on_image(self, image, ann, color):
+    def annotation_extent(self, ann):
+        """
+        The (x0, y0, x1, y1) region draw_box_on_image can touch: box and label.
+        """
+        x, y, w, h = (int(v) for v in ann["bbox"])
+        (text_w, text_h), baseline = cv2.getTextSize(
+            "id: " + str(ann["id"]), cv2.FONT_HERSHEY_SIMPLEX, 0.9, 4
+        )
+        pad = max(self.box_width, 4)
+        return (
+            x - pad,
+            min(y, y - 10 - text_h) - pad,
+            max(x + w, x + text_w) + pad + 1,
+            max(y + h, y - 10 + baseline) + pad + 1,
+        )
+
+    def draw_box_on_image(self, image, ann, color, origin=(0, 0)):
         x, y, w, h = ann["bbox"]
-        x, y, w, h = int(x), int(y), int(w), int(h)
+        x, y, w, h = int(x) - origin[0], int(y) - origin[1], int(w), int(h)
         if color == (0, 0, 0):
             image = cv2.rectangle(image, (x, y), (x + w, y + h), color, -1)
         else:
@@ -52,11 +103,22 @@ class DisplayUtils:
         )
         return image
 
-    def draw_annotations(self, image, annotations, colors):
+    @profiler.timed("display.draw_annotations")
+    def draw_annotations(self, image, annotations, colors, origin=(0, 0), masks={}):
+        """
+        Draws onto image, which may be the region of the frame starting at
+        origin. masks overrides the cached mask of some annotation ids.
+        """
+        height, width = image.shape[:2]
+        x0, y0 = origin
         for ann, color in zip(annotations, colors):
-            image = self.draw_box_on_image(image, ann, color)
-            mask = self.__convert_ann_to_mask(ann, image.shape[0], image.shape[1])
-            image = self.overlay_mask_on_image(image, mask, color)
+            image = self.draw_box_on_image(image, ann, color, origin)
+            mask = masks.get(ann["id"])
+            if mask is None:
+                mask = self.__convert_ann_to_mask(ann)
+            image = self.overlay_roi_mask_on_image(
+                image, mask.window(x0, y0, x0 + width, y0 + height), color
+            )
         return image
 
     def draw_points(
@@ -1,12 +1,16 @@
+from collections import OrderedDict, deque
 from functools import lru_cache
 from pathlib import Path
-from threading import Thread
+from threading import Condition, Event, Lock, Thread
 
 import numpy as np
-from segment_anything_hq import SamPredictor
 
 from salt.dataset_explorer import DatasetExplorer
 from salt.display_utils import DisplayUtils
+from salt.inference_worker import InferenceError, create_predictor
+from salt.profiling import profiler
+from salt.rle import RoiMask
+from salt.similarity import DUPLICATE_SIMILARITY, INDEX_NAME, SimilarityIndex
 
 
 class CurrentCapturedInputs:
@@ -39,10 +43,141 @@ class CurrentCapturedInputs:
     def set_low_res_logits(self, low_res_logits):
         self.low_res_logits = low_res_logits
 
+    def remove_input_click(self, index):
+        self.input_points = np.delete(self.input_points, index, axis=0)
+        self.input_labels = np.delete(self.input_labels, index)
+        if len(self.input_points) == 0:
+            self.input_points = None
+            self.input_labels = None
+
+    def get_prompt(self):
+        return self.input_points, self.input_labels, self.input_box
+
+    def set_prompt(self, prompt):
+        self.input_points, self.input_labels, self.input_box = prompt
+
+    def has_prompt(self):
+        return self.input_points is not None or self.input_box is not None
+
+
+class PromptResult:
+    """
+    Decoder output for one prompt: candidates ranked by predicted IoU and the
+    candidate currently picked. Masks are upsampled from the low-res logits
+    only inside the object's region, and only when first shown.
+    """
+
+    def __init__(self, iou_predictions, low_res_logits, image_shape):
+        order = np.argsort(-iou_predictions)
+        self.iou_predictions = iou_predictions[order]
+        self.low_res_logits = low_res_logits[order]
+        self.image_shape = image_shape
+        self.masks = [None] * len(order)
+        self.selected = 0
+
+    def num_candidates(self):
+        return len(self.masks)
+
+    def cycle(self):
+        self.selected = (self.selected + 1) % self.num_candidates()
+
+    def mask(self):
+        if self.masks[self.selected] is None:
+            self.masks[self.selected] = RoiMask.from_logits(
+                self.low_res_logits[self.selected], self.image_shape
+            )
+        return self.masks[self.selected]
+
+    def logits(self):
+        return self.low_res_logits[self.selected][None, :, :]
+
+    def iou(self):
+        return float(self.iou_predictions[self.selected])
+
+
+def prompt_fingerprint(points, labels, box):
+    key = []
+    for value in (points, labels, box):
+        if value is None:
+            key.append(None)
+        else:
+            value = np.asarray(value, dtype=np.float32)
+            key.append((value.shape, value.tobytes()))
+    return tuple(key)
+
+
+class PromptHistory:
+    """
+    The prompt steps taken on one image, with the decoder output of every
+    prompt seen so far cached by fingerprint. Undo, redo and removing a click
+    are lookups; a new prompt is decoded from the logits of its longest cached
+    prefix.
+    """
+
+    def __init__(self, max_cached=16):
+        self.steps = []
+        self.position = -1
+        self.cache = OrderedDict()
+        self.max_cached = max_cached
+
+    def clear_steps(self):
+        self.steps = []
+        self.position = -1
+
+    def push(self, prompt):
+        self.steps = self.steps[: self.position + 1]
+        self.steps.append(prompt)
+        self.position += 1
+
+    def undo(self):
+        if self.position < 0:
+            return None
+        self.position -= 1
+        return self.current()
+
+    def redo(self):
+        if self.position + 1 >= len(self.steps):
+            return None
+        self.position += 1
+        return self.current()
+
+    def current(self):
+        if self.position < 0:
+            return (None, None, None)
+        return self.steps[self.position]
+
+    def lookup(self, prompt):
+        key = prompt_fingerprint(*prompt)
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+        return result
+
+    def store(self, prompt, result):
+        self.cache[prompt_fingerprint(*prompt)] = result
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+
+    def prior_logits(self, prompt):
+        points, labels, box = prompt
+        num_points = 0 if points is None else len(points)
+        for k in range(num_points - 1, -1, -1):
+            if k == 0 and box is None:
+                break
+            prefix = (points[:k] if k else None, labels[:k] if k else None, box)
+            result = self.lookup(prefix)
+            if result is not None:
+                return result.logits()
+        return None
+
+
+def regions_overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
 
 class Editor:
     def __init__(
-        self, sam, dataset_path, categories=None, dataset_json_path=None
+        self, sam, dataset_path, categories=None, dataset_json_path=None, session=None
     ):
         self.dataset_path = Path(dataset_path)
         if categories is None and dataset_json_path is None:
@@ -51,138 +186,788 @@ class Editor:
             dataset_json_path = self.dataset_path / "annotations.json"
         self.dataset_json_path = Path(dataset_json_path)
         self.dataset_explorer = DatasetExplorer(
-            self.dataset_path, categories=categories, dataset_json_path=self.dataset_json_path
+            self.dataset_path,
+            categories=categories,
+            dataset_json_path=self.dataset_json_path,
+            session=session,
         )
+        # session holding the lease on the current image, if not ours
+        self.locked_by = None
+        self.leased_image_id = None
         self.curr_inputs = CurrentCapturedInputs()
+        # prompt histories of the last few images, see PromptHistory
+        self.histories = OrderedDict()
+        self.history = None
         self.categories, self.category_colors = self.dataset_explorer.get_categories(
             get_colors=True
         )
-        self.image_id = 0
+        # start on the first image no other session is working on
+        self.image_id = self.dataset_explorer.next_available_image(-1)
+        if self.image_id is None:
+            self.image_id = 0
         self.category_id = 0
+        self.category_filter = None
+        # ask for several candidates when a prompt is ambiguous
+        self.multimask_output = True
+        self.curr_result = None
+        # (category id, mask) pairs waiting to be accepted with accept_proposals
+        self.proposals = []
+        self.similarity = None
+        # frame whose annotations are proposed on the current one, see toggle_sequence_mode
+        self.sequence_mode = False
+        self.sequence_source = None
+        # brush and eraser: the stored annotation being edited (None for the
+        # live mask) and its working copy, see begin_stroke
+        self.brush_radius = 10
+        self.edit_annotation = None
+        self.edit_mask = None
         self.show_other_anns = True
         self.sam = sam
         self.predictor = None
         self.du = DisplayUtils()
+        # full frames of the last few images, see get_cached_image_data
+        self.image_cache = OrderedDict()
+        self.image_loads = {}
+        # images to decode ahead of being opened, served newest first by one thread
+        self.warm_queue = deque(maxlen=2)
+        self.warm_ready = Condition()
+        self.warm_thread = None
+        self.image_cache_lock = Lock()
+        # downscaled frame shown until the full one is decoded, and its scale
+        self.proxy = None
+        self.display_scale = 1.0
+        # called with the image id, from a loader thread, once a full frame is
+        # ready. Without it, update_image blocks on the decode instead
+        self.on_image_loaded = None
+        # called on the GUI thread when another session takes the current image
+        self.on_lock_lost = None
+        # called on the GUI thread with the message of an inference worker failure
+        self.on_model_error = None
         self.update_image()
+        # another session can take it between the check and the claim
+        while self.locked_by is not None:
+            image_id = self.dataset_explorer.next_available_image(self.image_id)
+            if image_id is None:
+                break
+            self.image_id = image_id
+            self.update_image()
 
     def list_annotations(self):
         anns, colors = self.dataset_explorer.get_annotations(
             self.image_id, return_colors=True
         )
+        if self.category_filter is not None:
+            filtered = [
+                (ann, color)
+                for ann, color in zip(anns, colors)
+                if ann["category_id"] == self.category_filter
+            ]
+            anns = [ann for ann, _ in filtered]
+            colors = [color for _, color in filtered]
         return anns, colors
 
+    def __hold_lease(self, holder):
+        """
+        Makes the image read-only if holder, the session that took it, is not
+        None. Returns whether the image is still ours.
+        """
+        if holder is None:
+            return True
+        self.locked_by = holder
+        if self.on_lock_lost is not None:
+            self.on_lock_lost()
+        return False
+
+    def __renew_lease(self):
+        # an idle lease expires, so it is renewed while the user works on the image
+        if self.locked_by is not None:
+            return False
+        return self.__hold_lease(self.dataset_explorer.renew_claim(self.image_id))
+
     def delete_annotations(self, annotation_id):
-        self.dataset_explorer.delete_annotations(self.image_id, annotation_id)
+        if self.locked_by is not None:
+            return
+        self.__hold_lease(self.dataset_explorer.delete_annotations(self.image_id, annotation_id))
 
-    def __draw_known_annotations(self, selected_annotations=[]):
-        anns, colors = self.dataset_explorer.get_annotations(
-            self.image_id, return_colors=True
-        )
+    def recategorize_annotations(self, annotation_ids):
+        if self.locked_by is not None:
+            return
+        for annotation_id in annotation_ids:
+            holder = self.dataset_explorer.set_annotation_category(
+                self.image_id, annotation_id, self.category_id
+            )
+            if not self.__hold_lease(holder):
+                return
+
+    def set_category_filter(self, category_id, selected_annotations=[]):
+        self.category_filter = category_id
+        self.__draw(selected_annotations)
+
+    def __draw_known_annotations(self, selected_annotations=[], region=None):
+        anns, colors = self.list_annotations()
         if selected_annotations:
-            anns, colors = zip(*((ann, color) for ann, color in zip(anns, colors) if ann["id"] in selected_annotations))
-        # Use this to list the annotations
-        self.display = self.du.draw_annotations(self.display, anns, colors)
+            selected = [
+                (ann, color)
+                for ann, color in zip(anns, colors)
+                if ann["id"] in selected_annotations
+            ]
+            anns = [ann for ann, _ in selected]
+            colors = [color for _, color in selected]
+        masks = {}
+        if self.edit_annotation is not None:
+            # the annotation being brushed is drawn from its working copy
+            masks[self.edit_annotation["id"]] = self.edit_mask
+        if region is None:
+            # Use this to list the annotations
+            self.display = self.du.draw_annotations(self.display, anns, colors, masks=masks)
+            return
+        x0, y0, x1, y1 = region
+        overlapping = [
+            (ann, color)
+            for ann, color in zip(anns, colors)
+            if regions_overlap(self.du.annotation_extent(ann), region)
+        ]
+        self.du.draw_annotations(
+            self.display[y0:y1, x0:x1],
+            [ann for ann, _ in overlapping],
+            [color for _, color in overlapping],
+            origin=(x0, y0),
+            masks=masks,
+        )
 
-    def __draw(self, selected_annotations=[]):
-        self.display = self.image_bgr.copy()
+    @profiler.timed("editor.draw")
+    def __draw(self, selected_annotations=[], region=None):
+        """
+        Renders the display, or only the (x0, y0, x1, y1) region of it. A region
+        is rendered exactly as the same pixels of a full redraw.
+        """
+        if self.image_bgr is None:
+            # annotations are drawn once the full frame arrives
+            self.display = self.proxy.copy()
+            return
+        if region is None:
+            self.display = self.image_bgr.copy()
+            x0, y0 = 0, 0
+            view = self.display
+        else:
+            x0, y0, x1, y1 = region
+            view = self.display[y0:y1, x0:x1]
+            view[:] = self.image_bgr[y0:y1, x0:x1]
+        height, width = view.shape[:2]
         if self.curr_inputs.curr_mask is not None:
             if self.curr_inputs.input_points is not None:
-                self.display = self.du.draw_points(
-                    self.display, self.curr_inputs.input_points, self.curr_inputs.input_labels
+                self.du.draw_points(
+                    view,
+                    self.curr_inputs.input_points - np.array([x0, y0]),
+                    self.curr_inputs.input_labels,
                 )
-            self.display = self.du.overlay_mask_on_image(
-                self.display, self.curr_inputs.curr_mask
+            self.du.overlay_roi_mask_on_image(
+                view, self.curr_inputs.curr_mask.window(x0, y0, x0 + width, y0 + height)
+            )
+        for category_id, mask in self.proposals:
+            self.du.overlay_roi_mask_on_image(
+                view,
+                mask.window(x0, y0, x0 + width, y0 + height),
+                self.category_colors[category_id],
             )
         if self.show_other_anns or selected_annotations:
-            self.__draw_known_annotations(selected_annotations)
-
-    def update_overlay(self, selected_annotations=[]):
-        masks, _, low_res_logits = self.predictor.predict(
-            point_coords=self.curr_inputs.input_points,
-            point_labels=self.curr_inputs.input_labels,
-            box=self.curr_inputs.input_box,
-            mask_input=self.curr_inputs.low_res_logits,
-            multimask_output=False,
+            self.__draw_known_annotations(selected_annotations, region)
+
+    def __predict(self, prompt):
+        cached = self.history.lookup(prompt)
+        if cached is not None:
+            return cached
+        points, labels, box = prompt
+        mask_input = self.history.prior_logits(prompt)
+        # a single click is ambiguous (part, object, group), so ask for all
+        # candidates in the same decoder call; more clicks pin it down
+        multimask_output = (
+            self.multimask_output
+            and box is None
+            and points is not None
+            and len(points) == 1
+            and mask_input is None
         )
-        self.curr_inputs.set_mask(masks[0, :, :])
-        self.curr_inputs.set_low_res_logits(low_res_logits)
+        with profiler.span("editor.predict"):
+            iou_predictions, low_res_logits = self.predictor.predict_low_res(
+                point_coords=points,
+                point_labels=labels,
+                box=box,
+                mask_input=mask_input,
+                multimask_output=multimask_output,
+            )
+        result = PromptResult(iou_predictions, low_res_logits, self.image_bgr.shape[:2])
+        self.history.store(prompt, result)
+        return result
+
+    def __show_result(self, selected_annotations=[]):
+        self.curr_inputs.set_mask(self.curr_result.mask())
+        self.curr_inputs.set_low_res_logits(self.curr_result.logits())
         self.__draw(selected_annotations)
 
+    def __show_prompt(self, prompt, selected_annotations=[]):
+        self.curr_inputs.reset_inputs()
+        self.curr_inputs.set_prompt(prompt)
+        self.curr_result = None
+        if self.curr_inputs.has_prompt():
+            self.curr_result = self.__predict(prompt)
+            self.__show_result(selected_annotations)
+            return
+        self.__draw(selected_annotations)
+
+    def cycle_candidate(self, selected_annotations=[]):
+        if self.curr_result is None:
+            return
+        self.curr_result.cycle()
+        self.__show_result(selected_annotations)
+
+    def candidate_info(self):
+        if self.curr_result is None:
+            return None
+        return (
+            self.curr_result.selected,
+            self.curr_result.num_candidates(),
+            self.curr_result.iou(),
+        )
+
+    def update_overlay(self, selected_annotations=[]):
+        prompt = self.curr_inputs.get_prompt()
+        self.history.push(prompt)
+        self.__show_prompt(prompt, selected_annotations)
+
     def add_click(self, new_pt, new_label, selected_annotations=[]):
+        if self.predictor is None or not self.__renew_lease():
+            return
         self.curr_inputs.add_input_click(new_pt, new_label)
         self.update_overlay(selected_annotations)
 
-    def remove_click(self, new_pt):
-        print("ran remove click")
+    def remove_click(self, new_pt, selected_annotations=[], max_distance=20):
+        if self.predictor is None or self.curr_inputs.input_points is None:
+            return
+        distances = np.linalg.norm(
+            self.curr_inputs.input_points - np.asarray(new_pt), axis=1
+        )
+        index = int(np.argmin(distances))
+        if distances[index] > max_distance:
+            return
+        self.curr_inputs.remove_input_click(index)
+        self.update_overlay(selected_annotations)
+
+    def undo(self, selected_annotations=[]):
+        if self.predictor is None:
+            return
+        prompt = self.history.undo()
+        if prompt is not None:
+            self.__show_prompt(prompt, selected_annotations)
+
+    def redo(self, selected_annotations=[]):
+        if self.predictor is None:
+            return
+        prompt = self.history.redo()
+        if prompt is not None:
+            self.__show_prompt(prompt, selected_annotations)
 
     def set_bbox(self, bbox, selected_annotations=[]):
+        if self.predictor is None or not self.__renew_lease():
+            return
         self.curr_inputs.set_input_box(bbox)
         self.update_overlay(selected_annotations)
 
     def reset(self, hard=True, selected_annotations=[]):
+        """
+        Clears the prompt and the live mask. A soft reset, after the live mask
+        was added, keeps the proposals it does not cover at least half of.
+        """
+        mask = self.curr_inputs.curr_mask
+        if hard:
+            self.proposals = []
+        elif mask is not None:
+            self.proposals = [
+                (category_id, proposal)
+                for category_id, proposal in self.proposals
+                if 2 * mask.overlap(proposal) < proposal.area()
+            ]
         self.curr_inputs.reset_inputs()
+        self.curr_result = None
+        self.history.clear_steps()
         self.__draw(selected_annotations)
 
+    def similarity_index(self):
+        """
+        The index written by similarity_index.py, loaded on first use, or None.
+        """
+        if self.similarity is None:
+            index_path = self.dataset_path / INDEX_NAME
+            if index_path.exists():
+                self.similarity = SimilarityIndex.load(index_path)
+        return self.similarity
+
+    def goto_similar_unlabeled(self, k=64):
+        """
+        Jumps to the unlabeled image most similar to the current one, skipping
+        near-duplicates of images that are already labeled. Returns whether it moved.
+        """
+        index = self.similarity_index()
+        image_name = self.dataset_explorer.image_paths[self.image_id]
+        if index is None or image_name not in index:
+            return False
+        candidates = [
+            name
+            for name, _ in index.neighbors(image_name, k)
+            if not self.dataset_explorer.get_annotations(self.dataset_explorer.get_image_id(name))
+        ]
+        labeled_rows = [
+            index.rows[name]
+            for name, image_info in self.dataset_explorer.dataset["images"].items()
+            if image_info["annotations"] and name in index
+        ]
+        if candidates and labeled_rows:
+            matrix = index.matrix()
+            candidate_rows = [index.rows[name] for name in candidates]
+            closest = (matrix[candidate_rows] @ matrix[labeled_rows].T).max(axis=1)
+            candidates = [
+                name
+                for name, similarity in zip(candidates, closest)
+                if similarity < DUPLICATE_SIMILARITY
+            ]
+        for name in candidates:
+            image_id = self.dataset_explorer.get_image_id(name)
+            if self.dataset_explorer.is_available(image_id):
+                self.goto_image(image_id)
+                return True
+        return False
+
+    def propose_from_neighbor(self, selected_annotations=[], k=16):
+        """
+        Prompts the decoder with the boxes of the most similar labeled image,
+        scaled to this one, and shows the masks as proposals. Returns the
+        neighbor's name, or None if there is none.
+        """
+        if self.predictor is None or self.locked_by is not None:
+            return None
+        index = self.similarity_index()
+        image_name = self.dataset_explorer.image_paths[self.image_id]
+        if index is None or image_name not in index:
+            return None
+        for name, _ in index.neighbors(image_name, k):
+            neighbor_id = self.dataset_explorer.get_image_id(name)
+            annotations = self.dataset_explorer.get_annotations(neighbor_id)
+            if annotations:
+                break
+        else:
+            return None
+        self.__propose_from(neighbor_id, selected_annotations)
+        return name
+
+    def __propose_from(self, source_id, selected_annotations=[]):
+        """
+        Decodes the boxes of source_id's annotations, scaled to this image, in
+        one batch and shows the masks as proposals.
+        """
+        annotations = self.dataset_explorer.get_annotations(source_id)
+        if not annotations:
+            return
+        height, width = self.image_bgr.shape[:2]
+        source_height, source_width = self.dataset_explorer.get_image_size(source_id)
+        scale = np.array([width / source_width, height / source_height] * 2)
+        boxes = np.array(
+            [[x, y, x + w, y + h] for x, y, w, h in (a["bbox"] for a in annotations)]
+        ) * scale
+        with profiler.span("editor.propose"):
+            iou_predictions, low_res_logits = self.predictor.predict_boxes_low_res(boxes)
+        self.proposals = []
+        for annotation, iou, logits in zip(annotations, iou_predictions, low_res_logits):
+            mask = PromptResult(iou, logits, (height, width)).mask()
+            if not mask.is_empty():
+                self.proposals.append((annotation["category_id"], mask))
+        self.__draw(selected_annotations)
+
+    def toggle_sequence_mode(self, selected_annotations=[]):
+        """
+        In sequence mode, moving to an unlabeled frame proposes the previous
+        frame's annotations, re-decoded from their boxes.
+        """
+        self.sequence_mode = not self.sequence_mode
+        self.__carry_forward(selected_annotations)
+        return self.sequence_mode
+
+    def __carry_forward(self, selected_annotations=[]):
+        source_id = self.sequence_source
+        if (
+            not self.sequence_mode
+            or source_id is None
+            or self.predictor is None
+            or self.locked_by is not None
+            or self.dataset_explorer.get_annotations(self.image_id)
+        ):
+            return
+        # runs on every navigation, so a worker failure must not stop it
+        try:
+            self.__propose_from(source_id, selected_annotations)
+        except InferenceError as e:
+            self.__report_model_error(e)
+
+    def accept_proposals(self, selected_annotations=[]):
+        if not self.proposals or self.locked_by is not None:
+            return 0
+        num_accepted = 0
+        for category_id, mask in self.proposals:
+            holder = self.dataset_explorer.add_annotation(self.image_id, category_id, mask)
+            if not self.__hold_lease(holder):
+                break
+            num_accepted += 1
+        self.reset(selected_annotations=selected_annotations)
+        return num_accepted
+
+    def begin_stroke(self, selected_annotations=[]):
+        """
+        Starts brushing the live mask, or the selected annotation if exactly
+        one is selected and there is no live mask. Without either, strokes
+        paint a new live mask that can be added like a predicted one.
+        """
+        if self.image_bgr is None or not self.__renew_lease():
+            return False
+        self.edit_annotation = None
+        if self.curr_inputs.curr_mask is None and len(selected_annotations) == 1:
+            for ann in self.dataset_explorer.get_annotations(self.image_id):
+                if ann["id"] == selected_annotations[0]:
+                    self.edit_annotation = ann
+        if self.edit_annotation is not None:
+            self.edit_mask = RoiMask.from_rle(self.edit_annotation["segmentation"])
+        elif self.curr_inputs.curr_mask is not None:
+            # the prompt history may hold the same mask, so edit a copy
+            self.edit_mask = self.curr_inputs.curr_mask.copy()
+            self.curr_inputs.set_mask(self.edit_mask)
+        else:
+            height, width = self.image_bgr.shape[:2]
+            self.edit_mask = RoiMask.empty(height, width)
+            self.curr_inputs.set_mask(self.edit_mask)
+        return True
+
+    @profiler.timed("editor.stroke")
+    def stroke(self, start, end, erase=False, selected_annotations=[]):
+        """
+        Paints (or erases) a segment of the current stroke and redraws only the
+        region it touched. Returns that region, or None.
+        """
+        if self.edit_mask is None:
+            return None
+        region = self.edit_mask.paint(start, end, self.brush_radius, not erase)
+        x0, y0, x1, y1 = region
+        if x1 <= x0 or y1 <= y0:
+            return None
+        self.__draw(selected_annotations, region)
+        return region
+
+    def end_stroke(self, selected_annotations=[]):
+        """
+        Writes a brushed annotation back as RLE, encoding only its crop.
+        Returns the region of the display that changed, or None.
+        """
+        ann, mask = self.edit_annotation, self.edit_mask
+        self.edit_annotation = None
+        self.edit_mask = None
+        if ann is None:
+            return None
+        old_extent = self.du.annotation_extent(ann)
+        mask = mask.tight()
+        if mask.is_empty():
+            holder = self.dataset_explorer.delete_annotations(self.image_id, ann["id"])
+        else:
+            holder = self.dataset_explorer.set_annotation_mask(self.image_id, ann["id"], mask)
+        if not self.__hold_lease(holder):
+            # the stroke may reach past the annotation, so nothing smaller is safe to redraw
+            self.__draw(selected_annotations)
+            height, width = self.image_bgr.shape[:2]
+            return (0, 0, width, height)
+        if not mask.is_empty():
+            # the new counts are a cache miss, and decoding them again is wasted work
+            self.du.cache_mask(ann, mask)
+        new_extent = self.du.annotation_extent(ann)
+        height, width = self.image_bgr.shape[:2]
+        region = (
+            max(0, min(old_extent[0], new_extent[0])),
+            max(0, min(old_extent[1], new_extent[1])),
+            min(width, max(old_extent[2], new_extent[2])),
+            min(height, max(old_extent[3], new_extent[3])),
+        )
+        self.__draw(selected_annotations, region)
+        return region
+
+    def set_brush_radius(self, radius):
+        self.brush_radius = int(np.clip(radius, 1, 200))
+
     def toggle(self, selected_annotations=[]):
         self.show_other_anns = not self.show_other_anns
         self.__draw(selected_annotations)
 
     def step_up_transparency(self, selected_annotations=[]):
-        self.display = self.image_bgr.copy()
         self.du.increase_transparency()
         self.__draw(selected_annotations)
 
     def step_down_transparency(self, selected_annotations=[]):
-        self.display = self.image_bgr.copy()
         self.du.decrease_transparency()
         self.__draw(selected_annotations)
 
     def draw_selected_annotations(self, selected_annotations=[]):
         self.__draw(selected_annotations)
 
+    def __visible_annotations(self, selected_annotations):
+        anns, _ = self.list_annotations()
+        if selected_annotations:
+            return {ann["id"]: ann for ann in anns if ann["id"] in selected_annotations}
+        if self.show_other_anns:
+            return {ann["id"]: ann for ann in anns}
+        return {}
+
+    @profiler.timed("editor.select")
+    def select_annotations(self, previous_selection, selected_annotations, max_fraction=0.5):
+        """
+        Redraws for a new selection only the regions of the annotations that
+        appeared or disappeared. Returns those regions, or None after a full
+        redraw when they cover most of the frame anyway.
+        """
+        if self.image_bgr is None:
+            return []
+        before = self.__visible_annotations(previous_selection)
+        after = self.__visible_annotations(selected_annotations)
+        changed = [
+            ann
+            for ann_id, ann in {**before, **after}.items()
+            if (ann_id in before) != (ann_id in after)
+        ]
+        height, width = self.image_bgr.shape[:2]
+        regions = []
+        for ann in changed:
+            x0, y0, x1, y1 = self.du.annotation_extent(ann)
+            region = (max(0, x0), max(0, y0), min(width, x1), min(height, y1))
+            if region[2] > region[0] and region[3] > region[1]:
+                regions.append(region)
+        covered = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions)
+        if covered > max_fraction * height * width:
+            self.__draw(selected_annotations)
+            return None
+        for region in regions:
+            self.__draw(selected_annotations, region)
+        return regions
+
+    @profiler.timed("editor.save_ann")
     def save_ann(self):
-        self.dataset_explorer.add_annotation(
-            self.image_id, self.category_id, self.curr_inputs.curr_mask
+        if self.locked_by is not None:
+            return
+        self.__hold_lease(
+            self.dataset_explorer.add_annotation(
+                self.image_id, self.category_id, self.curr_inputs.curr_mask
+            )
         )
 
     def save(self):
         self.dataset_explorer.save_annotation()
 
-    # features are 84MB. don't cache too many
-    @lru_cache(maxsize=10)
-    def get_cached_image_data(self, image_id):
+    def create_predictor(self):
+        return create_predictor(self.sam)
+
+    def model_ready(self):
+        # an inference worker is unavailable while it restarts
+        return self.sam is not None and getattr(self.sam, "available", True)
+
+    def set_model(self, sam):
+        # called from the loader thread, encodes the current image so that
+        # attach_predictor on the GUI thread is a cache hit
+        self.sam = sam
+        self.get_cached_predictor(self.image_id)
+
+    def attach_predictor(self):
+        # while a proxy is shown, image_loaded attaches it with the full frame
+        if self.image_bgr is not None:
+            self.predictor = self.__open_predictor(self.image_id)
+        self.prefetch()
+
+    def __open_predictor(self, image_id):
+        # with the inference worker down, the image opens without a model and
+        # attach_predictor tries again once it is back
+        try:
+            return self.get_cached_predictor(image_id)
+        except InferenceError as e:
+            self.__report_model_error(e)
+            return None
+
+    def __report_model_error(self, error):
+        if self.on_model_error is not None:
+            self.on_model_error(str(error))
+
+    def __prefetch_predictor(self, image_id):
+        try:
+            self.get_cached_predictor(image_id)
+        except InferenceError:
+            # the worker reports its own restarts, and the image is encoded when opened
+            pass
+
+    def is_image_cached(self, image_id):
+        with self.image_cache_lock:
+            return image_id in self.image_cache
+
+    @profiler.timed("editor.load_image")
+    def get_cached_image_data(self, image_id, max_cached=10):
+        """
+        The full BGR frame of image_id, decoded once even when the prefetcher
+        and the GUI ask for it at the same time.
+        """
         if image_id < 0 or image_id >= self.dataset_explorer.get_num_images():
-            return None, None, None
-        image, image_bgr = self.dataset_explorer.get_image_data(image_id)
-        predictor = SamPredictor(self.sam)
-        predictor.set_image(image)
-        return image, image_bgr, predictor
+            return None
+        with self.image_cache_lock:
+            if image_id in self.image_cache:
+                self.image_cache.move_to_end(image_id)
+                return self.image_cache[image_id]
+            loading = self.image_loads.get(image_id)
+            if loading is None:
+                self.image_loads[image_id] = Event()
+        if loading is not None:
+            loading.wait()
+            with self.image_cache_lock:
+                return self.image_cache.get(image_id)
+        image_bgr = None
+        try:
+            image_bgr = self.dataset_explorer.get_image_data(image_id)
+        finally:
+            with self.image_cache_lock:
+                if image_bgr is not None:
+                    self.image_cache[image_id] = image_bgr
+                    while len(self.image_cache) > max_cached:
+                        self.image_cache.popitem(last=False)
+                self.image_loads.pop(image_id).set()
+        return image_bgr
 
-    def update_image(self):
-        self.image, self.image_bgr, self.predictor = self.get_cached_image_data(self.image_id)
-        # prefetch 5 images centered around current
+    # features are 84MB. don't cache too many
+    @lru_cache(maxsize=10)
+    @profiler.timed("editor.set_image")
+    def get_cached_predictor(self, image_id):
+        image_bgr = self.get_cached_image_data(image_id)
+        if image_bgr is None:
+            return None
+        predictor = self.create_predictor()
+        predictor.set_image(image_bgr, image_format="BGR")
+        return predictor
+
+    def prefetch(self):
+        # prefetch 5 images centered around current, with features once the model is loaded
+        target = self.__prefetch_predictor if self.model_ready() else self.get_cached_image_data
         for i in range(self.image_id - 2, self.image_id + 3):
-            Thread(
-                target=self.get_cached_image_data,
-                args=(i,)
-            ).start()
+            Thread(target=target, args=(i,), daemon=True).start()
+
+    def warm_image(self, image_id):
+        """
+        Queues image_id for decoding in the background, e.g. when it is about to
+        be opened. Requests older than the last two are dropped, so sweeping
+        over many images never decodes more than one frame at a time.
+        """
+        if self.is_image_cached(image_id):
+            return
+        with self.warm_ready:
+            if image_id in self.warm_queue:
+                return
+            self.warm_queue.append(image_id)
+            if self.warm_thread is None:
+                self.warm_thread = Thread(target=self.__warm_images, daemon=True)
+                self.warm_thread.start()
+            self.warm_ready.notify()
+
+    def __warm_images(self):
+        while True:
+            with self.warm_ready:
+                while not self.warm_queue:
+                    self.warm_ready.wait()
+                image_id = self.warm_queue.pop()
+            self.get_cached_image_data(image_id)
+
+    def __load_full_image(self, image_id):
+        if self.model_ready():
+            self.__prefetch_predictor(image_id)
+        self.get_cached_image_data(image_id)
+        self.on_image_loaded(image_id)
+
+    @profiler.timed("editor.update_image")
+    def update_image(self):
+        self.image_bgr = None
+        self.proxy = None
+        self.display_scale = 1.0
+        if self.on_image_loaded is not None and not self.is_image_cached(self.image_id):
+            # show a cheap reduced decode now and swap in the full frame when ready.
+            # the full frame is loaded even without a model or zoom: annotations
+            # are drawn and brushed at full resolution, and prefetch decodes it anyway
+            proxy = self.dataset_explorer.get_display_proxy(self.image_id)
+            if proxy is not None:
+                self.proxy, self.display_scale = proxy
+                Thread(
+                    target=self.__load_full_image, args=(self.image_id,), daemon=True
+                ).start()
+        if self.proxy is None:
+            self.image_bgr = self.get_cached_image_data(self.image_id)
+        self.locked_by = self.dataset_explorer.claim_image(self.image_id, self.leased_image_id)
+        self.leased_image_id = self.image_id
+        if self.image_id not in self.histories:
+            self.histories[self.image_id] = PromptHistory()
+        self.histories.move_to_end(self.image_id)
+        while len(self.histories) > 3:
+            self.histories.popitem(last=False)
+        self.history = self.histories[self.image_id]
+        self.predictor = None
+        if self.model_ready() and self.image_bgr is not None:
+            self.predictor = self.__open_predictor(self.image_id)
+        self.prefetch()
 
-        self.display = self.image_bgr.copy()
         self.reset()
+        self.__carry_forward()
+
+    def image_loaded(self, image_id, selected_annotations=[]):
+        """
+        Swaps the proxy for the full frame if image_id is still the current image.
+        Returns whether the display changed.
+        """
+        if image_id != self.image_id or self.image_bgr is not None:
+            return False
+        self.image_bgr = self.get_cached_image_data(image_id)
+        self.proxy = None
+        self.display_scale = 1.0
+        if self.model_ready():
+            self.predictor = self.__open_predictor(image_id)
+        self.reset(selected_annotations=selected_annotations)
+        self.__carry_forward(selected_annotations)
+        return True
 
     def next_image(self):
-        if self.image_id == self.dataset_explorer.get_num_images() - 1:
+        # skips images other sessions are working on
+        image_id = self.dataset_explorer.next_available_image(self.image_id, 1)
+        if image_id is None:
             return
-        self.image_id += 1
+        self.sequence_source = self.image_id
+        self.image_id = image_id
         self.update_image()
 
     def prev_image(self):
-        if self.image_id == 0:
+        image_id = self.dataset_explorer.next_available_image(self.image_id, -1)
+        if image_id is None:
             return
-        self.image_id -= 1
+        self.sequence_source = self.image_id
+        self.image_id = image_id
         self.update_image()
 
+    def goto_image(self, image_id):
+        if image_id < 0 or image_id >= self.dataset_explorer.get_num_images():
+            return
+        self.sequence_source = None
+        self.image_id = image_id
+        self.update_image()
+
+    def find_image(self, query):
+        image_id = self.dataset_explorer.find_image(query, start=self.image_id)
+        if image_id is None:
+            return False
+        self.goto_image(image_id)
+        return True
+
     def fast_forward(self):
+        self.sequence_source = None
         i = 0
         while i < self.dataset_explorer.get_num_images():
             if not self.dataset_explorer.get_annotations(i):
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import cv2
+import numpy as np
+from pycocotools import mask as mask_utils
+
+from salt.rle import RoiMask
+
+FORMATS = ("coco", "yolo", "png")
+MANIFEST_NAME = "export_manifest.json"
+
+
+def decode_in_bbox(segmentation, bbox, margin=1):
+    """
+    Decodes an RLE and returns the part of it inside the (padded) bbox, with
+    the crop's top-left corner.
+    """
+    height, width = segmentation["size"]
+    x, y, w, h = bbox
+    x0, y0 = max(int(x) - margin, 0), max(int(y) - margin, 0)
+    x1 = min(int(np.ceil(x + w)) + margin, width)
+    y1 = min(int(np.ceil(y + h)) + margin, height)
+    # decodes only the crop, not the frame
+    mask = RoiMask.from_rle(segmentation, (x0, y0, x1, y1))
+    return mask.crop.astype(np.uint8), mask.x0, mask.y0
+
+
+def mask_to_polygons(mask, offset=(0, 0), epsilon=1.0):
+    """
+    Outer contours of a binary mask as (N, 2) arrays of x, y, simplified with
+    Douglas-Peucker at epsilon pixels. Polygons with fewer than 3 points are
+    dropped.
+    """
+    contours, _ = cv2.findContours(
+        mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=offset
+    )
+    polygons = []
+    for contour in contours:
+        if epsilon > 0:
+            contour = cv2.approxPolyDP(contour, epsilon, True)
+        if len(contour) < 3:
+            continue
+        polygons.append(contour.reshape(-1, 2))
+    return polygons
+
+
+def annotations_hash(image_info):
+    payload = json.dumps(
+        [image_info["width"], image_info["height"], image_info["annotations"]],
+        sort_keys=True,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def output_stem(image_name):
+    # YOLO finds an image's labels by its file name without the extension
+    return os.path.splitext(os.path.basename(image_name))[0]
+
+
+def check_output_stems(image_names):
+    """
+    Raises ValueError if images share an output stem (a.jpg and a.png, or the
+    same name in two folders), since their outputs would overwrite each other.
+    """
+    by_stem = {}
+    for image_name in image_names:
+        by_stem.setdefault(output_stem(image_name), []).append(image_name)
+    collisions = [sorted(names) for names in by_stem.values() if len(names) > 1]
+    if collisions:
+        listed = ", ".join(" and ".join(names) for names in sorted(collisions)[:5])
+        raise ValueError(
+            f"{len(collisions)} output names are shared by several images ({listed}), "
+            "rename the images so their names differ without the extension"
+        )
+
+
+def export_image(image_name, image_info, output_path, formats, epsilon):
+    """
+    Writes the per-image outputs (YOLO labels, PNG maps) and returns the
+    image's annotations with polygon segmentations for the COCO file.
+    Runs in a worker process.
+    """
+    output_path = Path(output_path)
+    width, height = image_info["width"], image_info["height"]
+    stem = output_stem(image_name)
+    coco_annotations = []
+    yolo_lines = []
+    if "png" in formats:
+        instance_map = np.zeros((height, width), dtype=np.uint16)
+        semantic_map = np.zeros((height, width), dtype=np.uint8)
+
+    for index, ann in enumerate(image_info["annotations"]):
+        crop, x0, y0 = decode_in_bbox(ann["segmentation"], ann["bbox"])
+        polygons = mask_to_polygons(crop, offset=(x0, y0), epsilon=epsilon)
+        if "coco" in formats:
+            coco_annotations.append(
+                {
+                    "id": ann["id"],
+                    "category_id": ann["category_id"],
+                    "bbox": ann["bbox"],
+                    "area": float(mask_utils.area(ann["segmentation"])),
+                    "iscrowd": 0,
+                    "segmentation": [p.astype(float).ravel().tolist() for p in polygons],
+                }
+            )
+        if "yolo" in formats:
+            for polygon in polygons:
+                normalized = polygon / np.array([width, height], dtype=float)
+                coords = " ".join(f"{v:.6f}" for v in normalized.ravel())
+                yolo_lines.append(f"{ann['category_id']} {coords}")
+        if "png" in formats:
+            h, w = crop.shape
+            region = crop.astype(bool)
+            instance_map[y0 : y0 + h, x0 : x0 + w][region] = index + 1
+            semantic_map[y0 : y0 + h, x0 : x0 + w][region] = ann["category_id"] + 1
+
+    if "yolo" in formats:
+        with open(output_path / "labels" / f"{stem}.txt", "w") as f:
+            f.write("\n".join(yolo_lines) + ("\n" if yolo_lines else ""))
+    if "png" in formats:
+        cv2.imwrite(str(output_path / "instance_maps" / f"{stem}.png"), instance_map)
+        cv2.imwrite(str(output_path / "semantic_maps" / f"{stem}.png"), semantic_map)
+    return image_name, coco_annotations
+
+
+def remove_image_outputs(output_path, image_name):
+    stem = output_stem(image_name)
+    for path in (
+        output_path / "labels" / f"{stem}.txt",
+        output_path / "instance_maps" / f"{stem}.png",
+        output_path / "semantic_maps" / f"{stem}.png",
+    ):
+        if path.exists():
+            path.unlink()
+
+
+def load_manifest(output_path, formats, epsilon):
+    manifest_path = output_path / MANIFEST_NAME
+    if manifest_path.exists():
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest["formats"] == sorted(formats) and manifest["epsilon"] == epsilon:
+            return manifest
+    return {"formats": sorted(formats), "epsilon": epsilon, "images": {}}
+
+
+def write_coco(output_path, dataset, manifest):
+    images, annotations = [], []
+    for image_id, image_name in enumerate(sorted(dataset["images"])):
+        image_info = dataset["images"][image_name]
+        images.append(
+            {
+                "id": image_id,
+                "file_name": image_name,
+                "width": image_info["width"],
+                "height": image_info["height"],
+            }
+        )
+        for ann in manifest["images"][image_name]["coco"]:
+            annotations.append(dict(ann, image_id=image_id))
+    coco = {
+        "images": images,
+        "annotations": annotations,
+        "categories": [
+            {"id": i, "name": name} for i, name in enumerate(dataset["categories"])
+        ],
+    }
+    with open(output_path / "annotations_polygons.json", "w") as f:
+        json.dump(coco, f)
+
+
+def export_dataset(
+    dataset_json_path,
+    output_path,
+    formats=FORMATS,
+    epsilon=1.0,
+    workers=None,
+    max_in_flight=64,
+    incremental=True,
+):
+    """
+    Exports a SALT dataset to every requested format in a single pass over the
+    images, decoding and vectorizing in a process pool. At most max_in_flight
+    images are decoded at a time. With incremental, only images whose
+    annotations changed since the last export are processed again.
+    Returns the number of images exported. Raises ValueError if two images
+    would write the same output files.
+    """
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown export formats: {sorted(unknown)}")
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    if "yolo" in formats:
+        (output_path / "labels").mkdir(exist_ok=True)
+    if "png" in formats:
+        (output_path / "instance_maps").mkdir(exist_ok=True)
+        (output_path / "semantic_maps").mkdir(exist_ok=True)
+
+    with open(dataset_json_path, "r") as f:
+        dataset = json.load(f)
+    check_output_stems(dataset["images"])
+
+    manifest = load_manifest(output_path, formats, epsilon)
+    stems = {output_stem(image_name) for image_name in dataset["images"]}
+    for image_name in set(manifest["images"]) - set(dataset["images"]):
+        # the outputs of a deleted a.png are now a.jpg's
+        if output_stem(image_name) not in stems:
+            remove_image_outputs(output_path, image_name)
+        del manifest["images"][image_name]
+    if not incremental:
+        # after removing the outputs of deleted images, which only the manifest knows
+        manifest["images"] = {}
+
+    hashes = {
+        image_name: annotations_hash(image_info)
+        for image_name, image_info in dataset["images"].items()
+    }
+    todo = [
+        image_name
+        for image_name in dataset["images"]
+        if manifest["images"].get(image_name, {}).get("hash") != hashes[image_name]
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for image_name in todo:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, coco_annotations = future.result()
+                    manifest["images"][name] = {"hash": hashes[name], "coco": coco_annotations}
+            pending.add(
+                executor.submit(
+                    export_image,
+                    image_name,
+                    dataset["images"][image_name],
+                    output_path,
+                    formats,
+                    epsilon,
+                )
+            )
+        for future in wait(pending).done:
+            name, coco_annotations = future.result()
+            manifest["images"][name] = {"hash": hashes[name], "coco": coco_annotations}
+
+    if "coco" in formats:
+        write_coco(output_path, dataset, manifest)
+    if "yolo" in formats:
+        with open(output_path / "classes.txt", "w") as f:
+            f.write("\n".join(dataset["categories"]) + "\n")
+    with open(output_path / MANIFEST_NAME, "w") as f:
+        json.dump(manifest, f)
+    return len(todo)
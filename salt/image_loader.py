@@ -0,0 +1,142 @@
+import math
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def reduced_shape(height, width, factor):
+    # jpeg scales by ceil, other formats are resized with rounding, +1 covers both
+    if factor == 1:
+        return height, width, 3
+    return math.ceil(height / factor) + 1, math.ceil(width / factor) + 1, 3
+
+
+def reduce_factor_for(height, width, max_side):
+    """
+    The largest IMREAD_REDUCED_* factor that keeps the long side at least max_side.
+    """
+    factor = 1
+    for candidate in (2, 4, 8):
+        if max(height, width) / candidate >= max_side:
+            factor = candidate
+    return factor
+
+
+def decode_into(path, shm_name, capacity, factor):
+    """
+    Worker: decodes and copies the frame into a shared memory block allocated
+    by the caller. (cv2.imdecode has no output argument in Python, so the
+    decode cannot write into the block directly.)
+    Returns the decoded shape, or None if the frame does not fit (e.g. the
+    stored size is stale) or cannot be read.
+    """
+    image = cv2.imread(path, REDUCED_FLAGS[factor])
+    if image is None or image.nbytes > capacity:
+        return None
+    # the pool shares the caller's resource tracker, which owns the block
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        np.ndarray(image.shape, np.uint8, buffer=shm.buf)[:] = image
+    finally:
+        shm.close()
+    return image.shape
+
+
+class SharedBlocks:
+    """
+    Shared memory blocks handed out as numpy arrays. The caller unlinks a block
+    once the other process is done with it; the mapping is closed after its
+    array has been garbage collected.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.retired = []
+
+    def __retire(self, shm):
+        # the array is still being torn down when its finalizer runs, so the
+        # block can only be closed on a later call
+        with self.lock:
+            self.retired.append(shm)
+
+    def free_retired(self):
+        with self.lock:
+            retired, self.retired = self.retired, []
+        for shm in retired:
+            try:
+                shm.close()
+            except BufferError:
+                self.__retire(shm)
+
+    def create(self, capacity):
+        self.free_retired()
+        return shared_memory.SharedMemory(create=True, size=max(1, capacity))
+
+    def array(self, shm, shape, dtype=np.uint8):
+        array = np.ndarray(shape, dtype, buffer=shm.buf)
+        weakref.finalize(array, self.__retire, shm)
+        return array
+
+
+class ImageLoader:
+    """
+    Decodes images in a process pool. The worker copies each frame into shared
+    memory once, and the GUI process gets an array over that block, so a 100MP
+    frame is neither pickled nor copied again on the way back. A block is
+    freed once its array has been garbage collected.
+    """
+
+    def __init__(self, max_workers=2):
+        # fork would copy the GUI's threads into the workers
+        self.executor = ProcessPoolExecutor(
+            max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        # a spawn pool starts its workers one by one as tasks queue up, so one
+        # task each starts them all now. They take a moment to import cv2,
+        # until then frames are decoded in the calling thread
+        self.warmups = [self.executor.submit(int) for _ in range(max_workers)]
+        self.blocks = SharedBlocks()
+
+    def started(self):
+        return all(warmup.done() for warmup in self.warmups)
+
+    def load(self, path, size, factor=1):
+        """
+        Decodes path as BGR, downscaled by factor (1, 2, 4 or 8). size is the
+        (height, width) recorded for the image and sizes the shared block.
+        """
+        if not self.started():
+            return cv2.imread(str(path), REDUCED_FLAGS[factor])
+        shape = reduced_shape(*size, factor)
+        capacity = int(np.prod(shape))
+        shm = self.blocks.create(capacity)
+        try:
+            decoded_shape = self.executor.submit(
+                decode_into, str(path), shm.name, capacity, factor
+            ).result()
+        except RuntimeError:
+            # the pool is shut down at exit, while prefetch threads may still run
+            decoded_shape = None
+        finally:
+            # the mapping outlives the name, so nothing is left behind if we crash
+            shm.unlink()
+        if decoded_shape is None:
+            shm.close()
+            return cv2.imread(str(path), REDUCED_FLAGS[factor])
+        return self.blocks.array(shm, decoded_shape)
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.blocks.free_retired()
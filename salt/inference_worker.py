@@ -0,0 +1,326 @@
+import itertools
+import multiprocessing
+import threading
+import weakref
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from salt.image_loader import SharedBlocks
+
+# low-res logits of up to three candidates, (3, 256, 256) float32
+LOGITS_CAPACITY = 3 * 256 * 256 * 4
+
+
+def create_predictor(sam):
+    # ONNX models and workers provide their own predictor, torch models use SamPredictor
+    if hasattr(sam, "create_predictor"):
+        return sam.create_predictor()
+    # imported lazily so the window can come up before torch is loaded
+    from salt.sam_predictor import RoiSamPredictor
+
+    return RoiSamPredictor(sam)
+
+
+def write_logits(logits, shm_name, capacity):
+    """
+    Worker: copies logits into the caller's block. Returns the shape and None,
+    or None and the array itself when it does not fit.
+    """
+    logits = np.ascontiguousarray(logits, dtype=np.float32)
+    if logits.nbytes > capacity:
+        return None, logits
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        np.ndarray(logits.shape, np.float32, buffer=shm.buf)[:] = logits
+    finally:
+        shm.close()
+    return logits.shape, None
+
+
+def handle(sam, predictors, max_cached, op, key, *args):
+    if op == "set_image":
+        shm_name, shape, image_format = args
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            # copied, the caller frees the block once we reply
+            image = np.array(np.ndarray(shape, np.uint8, buffer=shm.buf))
+        finally:
+            shm.close()
+        predictor = create_predictor(sam)
+        predictor.set_image(image, image_format=image_format)
+        predictors[key] = predictor
+        while len(predictors) > max_cached:
+            predictors.popitem(last=False)
+        return "ok", None
+
+    predictor = predictors.get(key)
+    if predictor is None:
+        # evicted, or this is a restarted worker
+        return "missing", None
+    predictors.move_to_end(key)
+    if op == "predict_low_res":
+        kwargs, shm_name, capacity = args
+        iou_predictions, logits = predictor.predict_low_res(**kwargs)
+    elif op == "predict_boxes_low_res":
+        boxes, shm_name, capacity = args
+        iou_predictions, logits = predictor.predict_boxes_low_res(boxes)
+    else:
+        raise ValueError(f"Unknown request {op}")
+    return "ok", (np.asarray(iou_predictions), *write_logits(logits, shm_name, capacity))
+
+
+def serve(foreground, background, load_model, max_cached):
+    """
+    Worker process: loads the model, then answers requests until both
+    connections close. Queued foreground requests go before background ones.
+    """
+    try:
+        sam = load_model()
+    except Exception as e:
+        foreground.send(("failed", f"Model failed to load: {e}"))
+        return
+    foreground.send(("ready", None))
+    predictors = OrderedDict()
+    connections = [foreground, background]
+    while connections:
+        ready = wait(connections)
+        connection = foreground if foreground in ready else ready[0]
+        try:
+            released, message = connection.recv()
+        except EOFError:
+            connections.remove(connection)
+            continue
+        for key in released:
+            predictors.pop(key, None)
+        try:
+            reply = handle(sam, predictors, max_cached, *message)
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+        connection.send(reply)
+
+
+class InferenceError(RuntimeError):
+    """
+    A request the inference worker could not answer: the model raised, the
+    worker crashed, or it is still restarting.
+    """
+
+
+class InferenceWorker:
+    """
+    Runs the model in a separate process, which owns the image features, so
+    encoding and decoding never hold the GUI process's GIL. Frames go to the
+    worker and logits come back through shared memory; the pipes only carry
+    prompts and shapes.
+    Stands in for a SAM model in Editor. If the worker dies, it is started
+    again on a background thread, and requests fail with InferenceError
+    until it is back; predictors then re-send their image when next used.
+    """
+
+    def __init__(self, load_model, max_cached=12):
+        self.load_model = load_model
+        self.max_cached = max_cached
+        # fork would copy the GUI's threads and CUDA state into the worker
+        self.context = multiprocessing.get_context("spawn")
+        self.blocks = SharedBlocks()
+        self.keys = itertools.count()
+        # finalizers append to it, possibly on a thread already holding the lock
+        self.released_lock = threading.RLock()
+        self.released = []
+        self.restart_lock = threading.Lock()
+        self.restart_thread = None
+        # the GUI thread has its own pipe, so prefetching never queues ahead of a click
+        self.channel_locks = {True: threading.Lock(), False: threading.Lock()}
+        self.generation = 0
+        self.process = None
+        self.connections = None
+        # the predictor used last, encoded again first after a restart
+        self.recent = None
+        # restart reports, called from the restart thread
+        self.on_progress = None
+        self.on_ready = None
+        self.on_failed = None
+        self.__start()
+
+    def __start(self):
+        foreground, worker_foreground = self.context.Pipe()
+        background, worker_background = self.context.Pipe()
+        process = self.context.Process(
+            target=serve,
+            args=(worker_foreground, worker_background, self.load_model, self.max_cached),
+            daemon=True,
+        )
+        process.start()
+        # our copies of the worker's ends would keep the pipes open after it dies
+        worker_foreground.close()
+        worker_background.close()
+        try:
+            status, payload = foreground.recv()
+        except EOFError:
+            process.join()
+            raise InferenceError("Inference worker exited while loading the model")
+        if status != "ready":
+            process.join()
+            raise InferenceError(payload)
+        with self.released_lock:
+            # pending releases refer to the previous worker's predictors
+            self.released = []
+        self.process = process
+        self.connections = {True: foreground, False: background}
+
+    def __report(self, callback, *args):
+        if callback is not None:
+            callback(*args)
+
+    def __restart(self, generation):
+        with self.restart_lock:
+            if generation != self.generation or self.restart_thread is not None:
+                # another thread already restarted it, or is restarting it
+                return
+            self.restart_thread = threading.Thread(target=self.__run_restart, daemon=True)
+            self.restart_thread.start()
+
+    def __run_restart(self):
+        self.__report(self.on_progress, "Model crashed, restarting...")
+        self.process.kill()
+        self.process.join()
+        try:
+            self.__start()
+            # the image being worked on is most likely the next one asked for
+            recent = self.recent() if self.recent is not None else None
+            if recent is not None and recent.image is not None:
+                self.__report(self.on_progress, "Encoding image...")
+                recent.send_image()
+        except InferenceError as e:
+            error = f"Model failed to restart: {e}"
+        else:
+            error = None
+        with self.restart_lock:
+            self.generation += 1
+            self.restart_thread = None
+        if error is not None:
+            self.__report(self.on_failed, error)
+        else:
+            self.__report(self.on_ready)
+
+    @property
+    def available(self):
+        return self.restart_thread is None
+
+    def request(self, *message):
+        """
+        Sends message from the calling thread's pipe and returns (status, payload).
+        Raises InferenceError if the model failed or the worker is down, in
+        which case a restart is started in the background.
+        """
+        with self.restart_lock:
+            restarting = self.restart_thread not in (None, threading.current_thread())
+            generation = self.generation
+        if restarting:
+            raise InferenceError("Model is restarting")
+        foreground = threading.current_thread() is threading.main_thread()
+        connection = self.connections[foreground]
+        try:
+            with self.channel_locks[foreground]:
+                with self.released_lock:
+                    released, self.released = self.released, []
+                connection.send((released, message))
+                status, payload = connection.recv()
+        except (EOFError, OSError):
+            self.__restart(generation)
+            raise InferenceError("Model crashed, restarting")
+        if status == "error":
+            raise InferenceError(payload)
+        return status, payload
+
+    def release(self, key):
+        # may run inside garbage collection, so it only queues the key for the next request
+        with self.released_lock:
+            self.released.append(key)
+
+    def create_predictor(self):
+        return RemotePredictor(self, next(self.keys))
+
+    def shutdown(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+        self.blocks.free_retired()
+
+
+class RemotePredictor:
+    """
+    A handle on the features of one image in the worker. Mirrors the parts of
+    SamPredictor that Editor uses.
+    """
+
+    def __init__(self, worker, key):
+        self.worker = worker
+        self.key = key
+        self.image = None
+        self.image_format = "RGB"
+        weakref.finalize(self, worker.release, key)
+
+    def set_image(self, image, image_format="RGB"):
+        self.image = image
+        self.image_format = image_format
+        self.send_image()
+
+    def send_image(self):
+        self.worker.recent = weakref.ref(self)
+        shm = self.worker.blocks.create(self.image.nbytes)
+        try:
+            np.ndarray(self.image.shape, np.uint8, buffer=shm.buf)[:] = self.image
+            self.worker.request(
+                "set_image", self.key, shm.name, self.image.shape, self.image_format
+            )
+        finally:
+            shm.unlink()
+            shm.close()
+
+    def __predict(self, op, args, capacity):
+        self.worker.recent = weakref.ref(self)
+        shm = self.worker.blocks.create(capacity)
+        try:
+            status, payload = self.worker.request(op, self.key, *args, shm.name, capacity)
+            if status == "missing":
+                self.send_image()
+                status, payload = self.worker.request(op, self.key, *args, shm.name, capacity)
+        except InferenceError:
+            shm.close()
+            raise
+        finally:
+            shm.unlink()
+        iou_predictions, shape, logits = payload
+        if logits is not None:
+            shm.close()
+            return iou_predictions, logits
+        return iou_predictions, self.worker.blocks.array(shm, shape, np.float32)
+
+    def predict_low_res(
+        self,
+        point_coords=None,
+        point_labels=None,
+        box=None,
+        mask_input=None,
+        multimask_output=False,
+    ):
+        kwargs = dict(
+            point_coords=point_coords,
+            point_labels=point_labels,
+            box=box,
+            mask_input=mask_input,
+            multimask_output=multimask_output,
+        )
+        return self.__predict("predict_low_res", (kwargs,), LOGITS_CAPACITY)
+
+    def predict_boxes_low_res(self, boxes):
+        boxes = np.asarray(boxes)
+        return self.__predict(
+            "predict_boxes_low_res", (boxes,), len(boxes) * 256 * 256 * 4
+        )
@@ -1,4 +1,7 @@
-from PyQt5.QtCore import QRectF, Qt, QPointF
+from functools import wraps
+
+import numpy as np
+from PyQt5.QtCore import QRectF, Qt, QPointF, QTimer, pyqtSignal
 from PyQt5.QtGui import (
     QImage,
     QMouseEvent,
@@ -11,12 +14,15 @@ from PyQt5.QtGui import (
 from PyQt5.QtWidgets import (
     QAbstractItemView,
     QApplication,
+    QComboBox,
     QGraphicsRectItem,
     QGraphicsScene,
     QGraphicsView,
     QHBoxLayout,
-    QListWidget,
-    QListWidgetItem,
+    QListView,
+    QLabel,
+    QLineEdit,
+    QProgressBar,
     QPushButton,
     QRadioButton,
     QScrollArea,
@@ -24,11 +30,31 @@ from PyQt5.QtWidgets import (
     QWidget,
 )
 
+from salt.annotation_list import AnnotationListModel
 from salt.editor import Editor
+from salt.inference_worker import InferenceError
+from salt.profiling import profiler
+from salt.thumbnail_view import ThumbnailGrid
 
 selected_annotations = []
 
 
+def shows_model_errors(handler):
+    """
+    Reports InferenceError in the status bar instead of letting it reach Qt,
+    which aborts on an exception raised in an event handler or slot.
+    """
+
+    @wraps(handler)
+    def wrapper(widget, *args, **kwargs):
+        try:
+            return handler(widget, *args, **kwargs)
+        except InferenceError as e:
+            widget.window().model_status.setText(str(e))
+
+    return wrapper
+
+
 class CustomGraphicsView(QGraphicsView):
     def __init__(self, editor: Editor):
         super(CustomGraphicsView, self).__init__()
@@ -57,13 +83,20 @@ class CustomGraphicsView(QGraphicsView):
         self.bbox = None
         self.bbox_start = None
 
+        # "brush" or "eraser" while a mask editing tool is active
+        self.tool = None
+        self.stroke_erase = False
+        self.stroke_last = None
+
     def set_image(self, q_img):
         pixmap = QPixmap.fromImage(q_img)
         if self.image_item:
             self.image_item.setPixmap(pixmap)
         else:
             self.image_item = self.scene.addPixmap(pixmap)
-        self.setSceneRect(QRectF(pixmap.rect()))
+        # display proxies are scaled up to the full frame's coordinates
+        self.image_item.setScale(self.editor.display_scale)
+        self.setSceneRect(self.image_item.sceneBoundingRect())
 
     def wheelEvent(self, event: QWheelEvent):
         modifiers = QApplication.keyboardModifiers()
@@ -78,6 +111,7 @@ class CustomGraphicsView(QGraphicsView):
             y = self.verticalScrollBar().value()
             self.verticalScrollBar().setValue(y - delta_y)
 
+    @profiler.timed("view.imshow")
     def imshow(self, img, reset_view=False):
         height, width, channel = img.shape
         bytes_per_line = 3 * width
@@ -88,13 +122,49 @@ class CustomGraphicsView(QGraphicsView):
         if reset_view:
             self.fitInView(self.sceneRect(), Qt.KeepAspectRatio)
 
+    @profiler.timed("view.update_region")
+    def update_region(self, img, region):
+        """
+        Repaints only the (x0, y0, x1, y1) region of the shown image from img.
+        """
+        if region is None or self.image_item is None:
+            return
+        x0, y0, x1, y1 = region
+        patch = np.ascontiguousarray(img[y0:y1, x0:x1])
+        q_patch = QImage(patch.data, x1 - x0, y1 - y0, 3 * (x1 - x0), QImage.Format_BGR888)
+        pixmap = self.image_item.pixmap()
+        # drop the item's reference so painting doesn't detach a full copy
+        self.image_item.setPixmap(QPixmap())
+        painter = QPainter(pixmap)
+        painter.drawImage(x0, y0, q_patch)
+        painter.end()
+        self.image_item.setPixmap(pixmap)
+
+    def scene_point(self, event):
+        pos = self.mapToScene(event.pos()) - self.image_item.pos()
+        return int(pos.x()), int(pos.y())
+
     def reset_bbox(self):
         if self.bbox is not None:
             self.scene.removeItem(self.bbox)
             self.bbox = None
 
+    @shows_model_errors
+    @profiler.timed("view.click")
     def mousePressEvent(self, event: QMouseEvent) -> None:
         modifiers = QApplication.keyboardModifiers()
+        if self.tool is not None and event.button() in (Qt.LeftButton, Qt.RightButton):
+            # the right button does the opposite of the tool
+            self.stroke_erase = (self.tool == "eraser") != (event.button() == Qt.RightButton)
+            if self.editor.begin_stroke(selected_annotations):
+                self.stroke_last = self.scene_point(event)
+                self.update_region(
+                    self.editor.display,
+                    self.editor.stroke(
+                        self.stroke_last, self.stroke_last, self.stroke_erase, selected_annotations
+                    ),
+                )
+            return
         if modifiers == Qt.ControlModifier:
             self.reset_bbox()
             self.bbox_start = event.pos()
@@ -103,18 +173,32 @@ class CustomGraphicsView(QGraphicsView):
             self.bbox.setBrush(Qt.transparent)
             self.scene.addItem(self.bbox)
         else:
-            pos = self.mapToScene(event.pos()) - self.image_item.pos()
-            x, y = int(pos.x()), int(pos.y())
+            x, y = self.scene_point(event)
             if event.button() == Qt.LeftButton:
                 label = 1
             elif event.button() == Qt.RightButton:
                 label = 0
+            elif event.button() == Qt.MiddleButton:
+                self.editor.remove_click([x, y], selected_annotations)
+                self.imshow(self.editor.display)
+                return
             else:
                 return
             self.editor.add_click([x, y], label, selected_annotations)
         self.imshow(self.editor.display)
+        self.window().show_candidate_info()
 
     def mouseMoveEvent(self, event: QMouseEvent):
+        if self.stroke_last is not None:
+            point = self.scene_point(event)
+            self.update_region(
+                self.editor.display,
+                self.editor.stroke(
+                    self.stroke_last, point, self.stroke_erase, selected_annotations
+                ),
+            )
+            self.stroke_last = point
+            return
         if self.bbox_start is not None:
             start = self.mapToScene(self.bbox_start)
             end = self.mapToScene(event.pos())
@@ -122,10 +206,21 @@ class CustomGraphicsView(QGraphicsView):
             self.bbox.setRect(r)
         super().mouseMoveEvent(event)
 
+    @shows_model_errors
+    @profiler.timed("view.release")
     def mouseReleaseEvent(self, event: QMouseEvent):
+        if self.stroke_last is not None:
+            self.stroke_last = None
+            edited_annotation = self.editor.edit_annotation is not None
+            self.update_region(self.editor.display, self.editor.end_stroke(selected_annotations))
+            if edited_annotation:
+                self.window().get_side_panel_annotations()
+            return
         if self.bbox_start is not None:
             start = self.bbox.rect().topLeft()
             end = self.bbox.rect().bottomRight()
+            # ends the drag even if the model fails
+            self.bbox_start = None
             self.editor.set_bbox(
                 [
                     int(start.x()),
@@ -135,33 +230,66 @@ class CustomGraphicsView(QGraphicsView):
                 ],
                 selected_annotations
             )
-            self.bbox_start = None
             self.imshow(self.editor.display)
         super().mouseReleaseEvent(event)
 
 
 class ApplicationInterface(QWidget):
-    def __init__(self, app, editor: Editor, panel_size=(1920, 1080)):
+    # emitted from the editor's loader threads when a full frame is decoded
+    image_loaded = pyqtSignal(int)
+
+    def __init__(self, app, editor: Editor, panel_size=(1920, 1080), review_mode=False):
         super(ApplicationInterface, self).__init__()
         self.app = app
         self.editor = editor
+        self.image_loaded.connect(self.full_image_loaded)
+        self.editor.on_image_loaded = self.image_loaded.emit
+        self.editor.on_lock_lost = self.show_lock_status
+        self.editor.on_model_error = self.show_model_error
         self.panel_size = panel_size
+        self.review_mode = review_mode
 
         self.layout = QVBoxLayout()
 
         self.top_bar = self.get_top_bar()
         self.layout.addWidget(self.top_bar)
 
+        self.status_bar = self.get_status_bar()
+        self.layout.addWidget(self.status_bar)
+
+        self.review_bar = self.get_review_bar()
+        self.layout.addWidget(self.review_bar)
+
         self.main_window = QHBoxLayout()
 
+        self.thumbnail_grid = ThumbnailGrid(editor)
+        self.thumbnail_grid.setFixedWidth(400)
+        self.thumbnail_grid.image_selected.connect(self.goto_image)
+        self.thumbnail_grid.hide()
+        self.main_window.addWidget(self.thumbnail_grid)
+
         self.graphics_view = CustomGraphicsView(editor)
         self.main_window.addWidget(self.graphics_view)
 
+        self.hud = QLabel(self.graphics_view)
+        self.hud.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 160); color: white;"
+            "font-family: monospace; padding: 4px"
+        )
+        self.hud.hide()
+        self.hud_timer = QTimer(self)
+        self.hud_timer.timeout.connect(self.update_hud)
+
         self.panel = self.get_side_panel()
-        self.panel_annotations = QListWidget()
+        self.annotation_list = AnnotationListModel(editor)
+        self.panel_annotations = QListView()
+        self.panel_annotations.setModel(self.annotation_list)
+        self.panel_annotations.setUniformItemSizes(True)
         self.panel_annotations.setFixedWidth(200)
         self.panel_annotations.setSelectionMode(QAbstractItemView.ExtendedSelection)
-        self.panel_annotations.itemSelectionChanged.connect(self.update_selected_annotations)
+        self.panel_annotations.selectionModel().selectionChanged.connect(
+            self.update_selected_annotations
+        )
         self.get_side_panel_annotations()
         self.side_panel_layout = QVBoxLayout()
         self.side_panel_layout.addWidget(self.panel)
@@ -180,36 +308,157 @@ class ApplicationInterface(QWidget):
 
     def reset(self):
         global selected_annotations
-        self.editor.reset(selected_annotations)
+        self.editor.reset(selected_annotations=selected_annotations)
         self.graphics_view.reset_bbox()
         self.graphics_view.imshow(self.editor.display)
 
     def add(self):
         global selected_annotations
         self.editor.save_ann()
-        self.editor.reset(selected_annotations)
+        # keeps the proposals the new annotation does not cover
+        self.editor.reset(hard=False, selected_annotations=selected_annotations)
         self.graphics_view.reset_bbox()
         self.graphics_view.imshow(self.editor.display)
 
+    @profiler.timed("ui.next_image")
     def next_image(self):
         global selected_annotations
         self.editor.next_image()
         selected_annotations = []
         self.graphics_view.imshow(self.editor.display, reset_view=True)
+        self.show_lock_status()
+        self.sync_thumbnails()
         self.save_all()
 
+    @profiler.timed("ui.prev_image")
     def prev_image(self):
         global selected_annotations
         self.editor.prev_image()
         selected_annotations = []
         self.graphics_view.imshow(self.editor.display, reset_view=True)
+        self.show_lock_status()
+        self.sync_thumbnails()
+        self.save_all()
+
+    @profiler.timed("ui.goto_image")
+    def goto_image(self, image_id):
+        global selected_annotations
+        if image_id == self.editor.image_id:
+            return
+        self.save_all()
+        self.editor.goto_image(image_id)
+        selected_annotations = []
+        self.graphics_view.imshow(self.editor.display, reset_view=True)
+        self.show_lock_status()
+        self.sync_thumbnails()
+        self.get_side_panel_annotations()
+        # keep the hotkeys from going to the grid's keyboard search
+        self.setFocus()
+
+    def goto_similar_unlabeled(self):
+        global selected_annotations
         self.save_all()
+        if not self.editor.goto_similar_unlabeled():
+            self.model_status.setText("No similar unlabeled image (run similarity_index.py)")
+            return
+        selected_annotations = []
+        self.graphics_view.imshow(self.editor.display, reset_view=True)
+        self.show_lock_status()
+        self.sync_thumbnails()
+        self.get_side_panel_annotations()
+
+    @shows_model_errors
+    def propose_from_neighbor(self):
+        neighbor = self.editor.propose_from_neighbor(selected_annotations)
+        if neighbor is None:
+            self.model_status.setText("No labeled neighbor to copy from")
+            return
+        self.model_status.setText(
+            f"{len(self.editor.proposals)} proposals from {neighbor}, Enter accepts, r rejects"
+        )
+        self.graphics_view.imshow(self.editor.display)
+
+    def accept_proposals(self):
+        if self.editor.accept_proposals(selected_annotations):
+            self.graphics_view.imshow(self.editor.display)
+            self.get_side_panel_annotations()
+
+    @shows_model_errors
+    def toggle_sequence_mode(self):
+        enabled = self.editor.toggle_sequence_mode(selected_annotations)
+        self.model_status.setText(
+            "Sequence mode: the previous frame's annotations are proposed, Enter accepts"
+            if enabled
+            else "Sequence mode off"
+        )
+        self.graphics_view.imshow(self.editor.display)
+
+    def select_tool(self, tool):
+        view = self.graphics_view
+        view.tool = None if view.tool == tool else tool
+        self.show_tool_status()
+
+    def show_tool_status(self):
+        tool = self.graphics_view.tool
+        if tool is None:
+            self.model_status.setText("")
+            return
+        self.model_status.setText(
+            f"{tool.capitalize()} (radius {self.editor.brush_radius}), "
+            "right button does the opposite, - and = resize"
+        )
+
+    def resize_brush(self, step):
+        radius = self.editor.brush_radius
+        new_radius = round(radius * 1.25**step)
+        if new_radius == radius:
+            new_radius += step
+        self.editor.set_brush_radius(new_radius)
+        self.show_tool_status()
+
+    def toggle_thumbnails(self):
+        self.thumbnail_grid.setVisible(not self.thumbnail_grid.isVisible())
+        self.sync_thumbnails()
+
+    def sync_thumbnails(self):
+        if self.thumbnail_grid.isVisible():
+            self.thumbnail_grid.show_current()
 
     def last_annotated_image(self):
         global selected_annotations
         self.editor.fast_forward()
         selected_annotations = []
         self.graphics_view.imshow(self.editor.display, reset_view=True)
+        self.show_lock_status()
+        self.sync_thumbnails()
+
+    @shows_model_errors
+    def undo(self):
+        self.editor.undo(selected_annotations)
+        self.graphics_view.imshow(self.editor.display)
+        self.show_candidate_info()
+
+    @shows_model_errors
+    def redo(self):
+        self.editor.redo(selected_annotations)
+        self.graphics_view.imshow(self.editor.display)
+        self.show_candidate_info()
+
+    def cycle_candidate(self):
+        self.editor.cycle_candidate(selected_annotations)
+        self.graphics_view.imshow(self.editor.display)
+        self.show_candidate_info()
+
+    def show_candidate_info(self):
+        info = self.editor.candidate_info()
+        if info is None or info[1] < 2:
+            if self.model_status.text().startswith("Mask "):
+                self.model_status.setText("Model ready")
+            return
+        selected, num_candidates, iou = info
+        self.model_status.setText(
+            f"Mask {selected + 1}/{num_candidates} (predicted IoU {iou:.2f}), c to cycle"
+        )
 
     def toggle(self):
         global selected_annotations
@@ -233,8 +482,6 @@ class ApplicationInterface(QWidget):
         button_layout = QHBoxLayout(top_bar)
         # self.layout.addLayout(button_layout)
         buttons = [
-            ("Add", lambda: [self.add(), self.get_side_panel_annotations()]),
-            ("Reset", lambda: self.reset()),
             ("Prev", lambda: [self.prev_image(), self.get_side_panel_annotations()]),
             ("Next", lambda: [self.next_image(), self.get_side_panel_annotations()]),
             (
@@ -245,6 +492,7 @@ class ApplicationInterface(QWidget):
                 ],
             ),
             ("Toggle", lambda: self.toggle()),
+            ("Thumbnails", lambda: self.toggle_thumbnails()),
             ("Transparency Up", lambda: self.transparency_up()),
             ("Transparency Down", lambda: self.transparency_down()),
             ("Save", lambda: self.save_all()),
@@ -253,6 +501,11 @@ class ApplicationInterface(QWidget):
                 lambda: self.delete_annotations(),
             ),
         ]
+        if not self.review_mode:
+            buttons = [
+                ("Add", lambda: [self.add(), self.get_side_panel_annotations()]),
+                ("Reset", lambda: self.reset()),
+            ] + buttons
         for button, lmb in buttons:
             bt = QPushButton(button)
             bt.clicked.connect(lmb)
@@ -260,6 +513,131 @@ class ApplicationInterface(QWidget):
 
         return top_bar
 
+    def toggle_hud(self):
+        if self.hud.isVisible():
+            self.hud_timer.stop()
+            self.hud.hide()
+            return
+        profiler.enabled = True
+        self.update_hud()
+        self.hud.show()
+        self.hud_timer.start(500)
+
+    def update_hud(self):
+        self.hud.setText(profiler.format_stats())
+        self.hud.adjustSize()
+        self.hud.move(8, 8)
+
+    def show_lock_status(self):
+        if self.editor.locked_by is not None:
+            self.model_status.setText(
+                f"Read-only: session '{self.editor.locked_by}' is working on this image"
+            )
+        elif self.model_status.text().startswith("Read-only"):
+            self.model_status.setText("Model ready" if self.editor.model_ready() else "")
+
+    def get_status_bar(self):
+        status_bar = QWidget()
+        status_layout = QHBoxLayout(status_bar)
+        status_layout.setContentsMargins(0, 0, 0, 0)
+        self.model_status = QLabel("Model not loaded")
+        self.model_progress = QProgressBar()
+        # busy indicator, the loader cannot report fractional progress
+        self.model_progress.setRange(0, 0)
+        self.model_progress.setFixedWidth(200)
+        status_layout.addWidget(self.model_status)
+        status_layout.addWidget(self.model_progress)
+        status_layout.addStretch()
+        if self.editor.model_ready():
+            self.model_status.setText("Model ready")
+            self.model_progress.hide()
+        elif self.review_mode:
+            self.model_status.setText("Review mode")
+            self.model_progress.hide()
+        return status_bar
+
+    def get_review_bar(self):
+        review_bar = QWidget()
+        review_layout = QHBoxLayout(review_bar)
+        review_layout.setContentsMargins(0, 0, 0, 0)
+
+        self.category_filter = QComboBox()
+        self.category_filter.addItem("All categories")
+        self.category_filter.addItems(self.editor.get_categories())
+        self.category_filter.currentIndexChanged.connect(self.filter_category)
+        review_layout.addWidget(QLabel("Show:"))
+        review_layout.addWidget(self.category_filter)
+
+        self.query = QLineEdit()
+        self.query.setPlaceholderText("Find image: name, cat:<category>, empty, annotated")
+        self.query.returnPressed.connect(self.find_image)
+        review_layout.addWidget(self.query)
+
+        buttons = [
+            ("Find Next", lambda: self.find_image()),
+            ("Set Category of Selected", lambda: self.recategorize_annotations()),
+        ]
+        for button, lmb in buttons:
+            bt = QPushButton(button)
+            bt.clicked.connect(lmb)
+            review_layout.addWidget(bt)
+        return review_bar
+
+    def filter_category(self, index):
+        global selected_annotations
+        category_id = None if index == 0 else index - 1
+        self.editor.set_category_filter(category_id, selected_annotations)
+        self.get_side_panel_annotations()
+        self.graphics_view.imshow(self.editor.display)
+
+    def find_image(self):
+        global selected_annotations
+        self.save_all()
+        try:
+            found = self.editor.find_image(self.query.text())
+        except ValueError as e:
+            self.model_status.setText(str(e))
+            return
+        if not found:
+            self.model_status.setText(f"No image matches '{self.query.text()}'")
+            return
+        self.model_status.setText(self.editor.dataset_explorer.image_paths[self.editor.image_id])
+        selected_annotations = []
+        self.graphics_view.imshow(self.editor.display, reset_view=True)
+        self.show_lock_status()
+        self.sync_thumbnails()
+        self.get_side_panel_annotations()
+        self.setFocus()
+
+    def recategorize_annotations(self):
+        global selected_annotations
+        self.editor.recategorize_annotations(selected_annotations)
+        self.get_side_panel_annotations()
+        self.clear_annotation_selection()
+        selected_annotations = []
+        self.reset()
+
+    def set_model_status(self, text):
+        # also reports a restart of the inference worker
+        self.model_status.setText(text)
+        self.model_progress.show()
+
+    def show_model_error(self, text):
+        self.model_status.setText(text)
+
+    def model_loaded(self):
+        self.editor.attach_predictor()
+        self.model_status.setText("Model ready")
+        self.model_progress.hide()
+
+    def full_image_loaded(self, image_id):
+        if self.editor.image_loaded(image_id, selected_annotations):
+            self.graphics_view.imshow(self.editor.display)
+
+    def model_failed(self, text):
+        self.model_status.setText(text)
+        self.model_progress.hide()
+
     def get_side_panel(self):
         panel = QWidget()
         panel_layout = QVBoxLayout(panel)
@@ -283,35 +661,42 @@ class ApplicationInterface(QWidget):
         return scroll
 
     def get_side_panel_annotations(self):
-        anns, colors = self.editor.list_annotations()
-        list_widget = self.panel_annotations
-        list_widget.clear()
-        # anns, colors = self.editor.get_annotations(self.editor.image_id)
-        categories = self.editor.get_categories(get_colors=False)
-        for i, ann in enumerate(anns):
-            listWidgetItem = QListWidgetItem(
-                str(ann["id"]) + " - " + (categories[ann["category_id"]])
-            )
-            list_widget.addItem(listWidgetItem)
-        return list_widget
+        # inserts and removes only the rows that changed
+        self.annotation_list.sync()
+        return self.panel_annotations
 
     def delete_annotations(self):
         global selected_annotations
         for annotation in selected_annotations:
             self.editor.delete_annotations(annotation)
         self.get_side_panel_annotations()
+        self.clear_annotation_selection()
         selected_annotations = []
         self.reset()
 
+    def clear_annotation_selection(self):
+        # the caller redraws, so no selection redraw is needed
+        selection = self.panel_annotations.selectionModel()
+        selection.blockSignals(True)
+        selection.clearSelection()
+        selection.blockSignals(False)
+        self.panel_annotations.viewport().update()
+
     def update_selected_annotations(self):
         global selected_annotations
-        selected_annotations = []
-        for item in self.panel_annotations.selectedItems():
-            i = int(item.text().split(" ")[0])
-            selected_annotations.append(i)
-        self.editor.draw_selected_annotations(selected_annotations)
-        self.graphics_view.imshow(self.editor.display)
-
+        previous_selection = selected_annotations
+        selected_annotations = [
+            index.data(Qt.UserRole)
+            for index in self.panel_annotations.selectionModel().selectedRows()
+        ]
+        regions = self.editor.select_annotations(previous_selection, selected_annotations)
+        if regions is None:
+            self.graphics_view.imshow(self.editor.display)
+            return
+        for region in regions:
+            self.graphics_view.update_region(self.editor.display, region)
+
+    @shows_model_errors
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_Escape:
             self.save_all()
@@ -333,6 +718,39 @@ class ApplicationInterface(QWidget):
             self.reset()
         if event.key() == Qt.Key_T:
             self.toggle()
+        if event.key() == Qt.Key_Delete:
+            self.delete_annotations()
+        if event.key() == Qt.Key_H:
+            self.toggle_hud()
+        if event.key() == Qt.Key_G:
+            self.toggle_thumbnails()
+        if event.key() == Qt.Key_U:
+            self.goto_similar_unlabeled()
+        if event.key() == Qt.Key_P:
+            self.propose_from_neighbor()
+        if event.key() == Qt.Key_V:
+            self.toggle_sequence_mode()
+        if event.key() == Qt.Key_B:
+            self.select_tool("brush")
+        if event.key() == Qt.Key_E:
+            self.select_tool("eraser")
+        if event.key() == Qt.Key_Minus:
+            self.resize_brush(-1)
+        if event.key() == Qt.Key_Equal:
+            self.resize_brush(1)
+        if event.key() in (Qt.Key_Return, Qt.Key_Enter):
+            self.accept_proposals()
+        if event.key() == Qt.Key_C:
+            self.cycle_candidate()
+        if event.modifiers() == Qt.ControlModifier and event.key() == Qt.Key_Z:
+            self.undo()
+        if (
+            event.modifiers() == Qt.ControlModifier and event.key() == Qt.Key_Y
+        ) or (
+            event.modifiers() == Qt.ControlModifier | Qt.ShiftModifier
+            and event.key() == Qt.Key_Z
+        ):
+            self.redo()
         if event.modifiers() == Qt.ControlModifier and event.key() == Qt.Key_S:
             self.save_all()
         elif event.key() == Qt.Key_Space:
@@ -342,4 +760,5 @@ class ApplicationInterface(QWidget):
             # pass
 
     def closeEvent(self, event):
+        self.thumbnail_grid.shutdown()
         self.save_all()
@@ -0,0 +1,30 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from salt.inference_worker import InferenceWorker
+
+
+class ModelLoader(QThread):
+    progress = pyqtSignal(str)
+    loaded = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, editor, load_model):
+        super(ModelLoader, self).__init__()
+        self.editor = editor
+        self.load_model = load_model
+
+    def run(self):
+        try:
+            self.progress.emit("Loading model...")
+            sam = self.load_model()
+            if isinstance(sam, InferenceWorker):
+                # restarts after a crash are reported like the first load
+                sam.on_progress = self.progress.emit
+                sam.on_ready = self.loaded.emit
+                sam.on_failed = self.failed.emit
+            self.progress.emit("Encoding image...")
+            self.editor.set_model(sam)
+        except Exception as e:
+            self.failed.emit(f"Model failed to load: {e}")
+            return
+        self.loaded.emit()
@@ -1,9 +1,42 @@
 import os
 
+import cv2
 import numpy as np
 import onnxruntime
 
-from salt.utils import apply_coords
+from salt.profiling import profiler
+from salt.utils import apply_coords, get_preprocess_shape
+
+
+class OnnxEncoder:
+    def __init__(self, onnx_models_path, quantized=True, num_threads=None):
+        self.onnx_models_path = onnx_models_path
+        onnx_model_path = os.path.join(self.onnx_models_path, "sam_encoder.quant.onnx")
+        # generate_onnx.py --encoder writes the int8 encoder only with --quantize
+        self.quantized = quantized and os.path.exists(onnx_model_path)
+        if not self.quantized:
+            onnx_model_path = os.path.join(self.onnx_models_path, "sam_encoder.onnx")
+        session_options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            session_options.intra_op_num_threads = num_threads
+        self.ort_session = onnxruntime.InferenceSession(
+            onnx_model_path, session_options, providers=["CPUExecutionProvider"]
+        )
+
+    @profiler.timed("onnx.encode")
+    def encode(self, image, image_format="RGB"):
+        """
+        Expects an RGB or BGR image in (H, W, 3) format. Returns the image embeddings
+        and the intermediate embeddings in the layout OnnxModels.call expects.
+        """
+        new_h, new_w = get_preprocess_shape(image.shape[0], image.shape[1], 1024)
+        input_image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        if image_format == "BGR":
+            # convert after resizing, on 1M pixels rather than the full frame
+            input_image = cv2.cvtColor(input_image, cv2.COLOR_BGR2RGB)
+        ort_inputs = {"input_image": input_image.astype(np.float32)}
+        image_embeddings, interm_embeddings = self.ort_session.run(None, ort_inputs)
+        return image_embeddings, interm_embeddings
 
 
 class OnnxModels:
@@ -16,6 +49,15 @@ class OnnxModels:
         self.ort_session = onnxruntime.InferenceSession(
             onnx_model_path, providers=["CPUExecutionProvider"]
         )
+        # optional decoder exported with multimask_output=True
+        self.ort_multimask_session = None
+        multimask_model_path = os.path.join(
+            self.onnx_models_path, f"sam_onnx_multimask.1500_2250.onnx"
+        )
+        if os.path.exists(multimask_model_path):
+            self.ort_multimask_session = onnxruntime.InferenceSession(
+                multimask_model_path, providers=["CPUExecutionProvider"]
+            )
 
     def __translate_input(
         self,
@@ -25,7 +67,10 @@ class OnnxModels:
         input_label,
         input_box=None,
         onnx_mask_input=None,
+        orig_im_size=None,
     ):
+        if orig_im_size is None:
+            orig_im_size = image.shape[:2]
         if input_box is None:
             onnx_coord = np.concatenate([input_point, np.array([[0.0, 0.0]])], axis=0)[
                 None, :, :
@@ -56,10 +101,11 @@ class OnnxModels:
             "point_labels": onnx_label,
             "mask_input": onnx_mask_input,
             "has_mask_input": onnx_has_mask_input,
-            "orig_im_size": np.array(image.shape[:2], dtype=np.float32),
+            "orig_im_size": np.array(orig_im_size, dtype=np.float32),
         }
         return ort_inputs
 
+    @profiler.timed("onnx.decode")
     def call(
         self,
         image,
@@ -68,10 +114,17 @@ class OnnxModels:
         input_label,
         input_box=None,
         low_res_logits=None,
+        multimask_output=False,
+        low_res_only=False,
     ):
         onnx_mask_input = None
         if low_res_logits is not None:
             onnx_mask_input = low_res_logits
+        orig_im_size = None
+        if low_res_only:
+            # the graph always upsamples; make that output tiny when only the
+            # low-res logits are wanted
+            orig_im_size = get_preprocess_shape(image.shape[0], image.shape[1], 256)
         ort_inputs = self.__translate_input(
             image,
             image_embedding,
@@ -79,7 +132,99 @@ class OnnxModels:
             input_label,
             input_box=input_box,
             onnx_mask_input=onnx_mask_input,
+            orig_im_size=orig_im_size,
         )
-        masks, _, low_res_logits = self.ort_session.run(None, ort_inputs)
+        ort_session = self.ort_session
+        if multimask_output and self.ort_multimask_session is not None:
+            ort_session = self.ort_multimask_session
+        masks, iou_predictions, low_res_logits = ort_session.run(None, ort_inputs)
         masks = masks > self.threshold
-        return masks, low_res_logits
+        return masks, iou_predictions, low_res_logits
+
+
+class OnnxPredictor:
+    """
+    Mirrors the parts of segment_anything_hq.SamPredictor that Editor uses, so
+    encoding and decoding can both run in ONNX Runtime without torch.
+    """
+
+    def __init__(self, encoder, decoder):
+        self.encoder = encoder
+        self.decoder = decoder
+        self.image = None
+        self.features = None
+
+    def set_image(self, image, image_format="RGB"):
+        self.image = image
+        self.features = self.encoder.encode(image, image_format)
+
+    def predict(
+        self,
+        point_coords=None,
+        point_labels=None,
+        box=None,
+        mask_input=None,
+        multimask_output=False,
+    ):
+        if point_coords is None:
+            point_coords = np.zeros((0, 2), dtype=np.float32)
+            point_labels = np.zeros(0, dtype=np.float32)
+        if mask_input is not None:
+            mask_input = mask_input[None, :, :, :].astype(np.float32)
+        masks, iou_predictions, low_res_logits = self.decoder.call(
+            self.image,
+            self.features,
+            point_coords,
+            point_labels,
+            input_box=box,
+            low_res_logits=mask_input,
+            multimask_output=multimask_output,
+        )
+        return masks[0], iou_predictions[0], low_res_logits[0]
+
+    def predict_low_res(
+        self,
+        point_coords=None,
+        point_labels=None,
+        box=None,
+        mask_input=None,
+        multimask_output=False,
+    ):
+        if point_coords is None:
+            point_coords = np.zeros((0, 2), dtype=np.float32)
+            point_labels = np.zeros(0, dtype=np.float32)
+        if mask_input is not None:
+            mask_input = mask_input[None, :, :, :].astype(np.float32)
+        _, iou_predictions, low_res_logits = self.decoder.call(
+            self.image,
+            self.features,
+            point_coords,
+            point_labels,
+            input_box=box,
+            low_res_logits=mask_input,
+            multimask_output=multimask_output,
+            low_res_only=True,
+        )
+        return iou_predictions[0], low_res_logits[0]
+
+    def predict_boxes_low_res(self, boxes):
+        # the exported decoder takes one prompt per run, so boxes are decoded in turn
+        results = [self.predict_low_res(box=box) for box in np.asarray(boxes)]
+        return (
+            np.stack([iou_predictions for iou_predictions, _ in results]),
+            np.stack([low_res_logits for _, low_res_logits in results]),
+        )
+
+
+class OnnxSam:
+    """
+    Stands in for a torch SAM model in Editor. The encoder and decoder sessions
+    are shared between all predictors created from it.
+    """
+
+    def __init__(self, onnx_models_path, quantized=True):
+        self.encoder = OnnxEncoder(onnx_models_path, quantized=quantized)
+        self.decoder = OnnxModels(onnx_models_path)
+
+    def create_predictor(self):
+        return OnnxPredictor(self.encoder, self.decoder)
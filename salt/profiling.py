@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from functools import wraps
+
+import numpy as np
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class Profiler:
+    """
+    Collects timing spans for the hot paths. When disabled a span is a shared
+    no-op context manager, so leaving the instrumentation in place is cheap.
+    """
+
+    def __init__(self, enabled=False, window=1000, max_events=200000):
+        self.enabled = enabled
+        self.window = window
+        self.durations = defaultdict(lambda: deque(maxlen=self.window))
+        self.counts = defaultdict(int)
+        self.events = deque(maxlen=max_events)
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter_ns()
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def timed(self, name):
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Span(self, name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def record(self, name, start, end):
+        with self.lock:
+            self.durations[name].append((end - start) / 1e6)
+            self.counts[name] += 1
+            self.events.append((name, start, end, threading.get_ident()))
+
+    def reset(self):
+        with self.lock:
+            self.durations.clear()
+            self.counts.clear()
+            self.events.clear()
+
+    def stats(self):
+        """
+        Per span name: call count and mean/p50/p90/p99/max in milliseconds over
+        the last `window` calls.
+        """
+        with self.lock:
+            durations = {name: np.array(d) for name, d in self.durations.items() if d}
+            counts = dict(self.counts)
+        stats = {}
+        for name, d in sorted(durations.items()):
+            p50, p90, p99 = np.percentile(d, [50, 90, 99])
+            stats[name] = {
+                "count": counts[name],
+                "mean": float(d.mean()),
+                "p50": float(p50),
+                "p90": float(p90),
+                "p99": float(p99),
+                "max": float(d.max()),
+            }
+        return stats
+
+    def format_stats(self):
+        lines = [f"{'span':<26}{'n':>6}{'p50':>9}{'p90':>9}{'p99':>9}"]
+        for name, s in self.stats().items():
+            lines.append(
+                f"{name:<26}{s['count']:>6}{s['p50']:>9.1f}{s['p90']:>9.1f}{s['p99']:>9.1f}"
+            )
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        # complete ("X") events in microseconds, loadable in chrome://tracing or Perfetto
+        with self.lock:
+            events = list(self.events)
+        pid = os.getpid()
+        trace_events = [
+            {
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - self.origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": pid,
+                "tid": tid,
+            }
+            for name, start, end, tid in events
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+profiler = Profiler(enabled=os.environ.get("SALT_PROFILE", "0") not in ("", "0"))
@@ -0,0 +1,193 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pycocotools import mask as mask_utils
+
+DEFAULT_THRESHOLDS = {
+    # pairs at or above this IoU are the same object annotated twice
+    "duplicate_iou": 0.9,
+    "overlap_iou": 0.5,
+    # share of the smaller mask covered by the other one
+    "contained_fraction": 0.95,
+    "min_area": 64,
+    # robust z-score on log area / log aspect ratio, per category
+    "outlier_z": 3.5,
+}
+
+
+def as_rle(segmentation):
+    rle = dict(segmentation)
+    if isinstance(rle["counts"], str):
+        rle["counts"] = rle["counts"].encode("utf-8")
+    return rle
+
+
+def check_image(image_name, image_info, thresholds):
+    """
+    Per-image checks, computed on RLE without decoding: empty and tiny masks,
+    out-of-bounds boxes, and pairwise IoU for duplicates, overlaps and masks
+    contained in another one. Also returns per-annotation features for the
+    dataset-wide outlier pass.
+    """
+    annotations = image_info["annotations"]
+    issues = []
+    if not annotations:
+        return issues, []
+    ids = [a["id"] for a in annotations]
+    categories = np.array([a["category_id"] for a in annotations])
+    rles = [as_rle(a["segmentation"]) for a in annotations]
+    areas = mask_utils.area(rles).astype(np.float64)
+    bboxes = mask_utils.toBbox(rles)
+
+    def issue(kind, annotation_ids, **details):
+        issues.append(dict(image=image_name, type=kind, annotations=annotation_ids, **details))
+
+    for i in np.flatnonzero(areas == 0):
+        issue("empty", [ids[i]])
+    for i in np.flatnonzero((areas > 0) & (areas < thresholds["min_area"])):
+        issue("tiny", [ids[i]], area=float(areas[i]))
+    stored = np.array([a["bbox"] for a in annotations], dtype=np.float64)
+    out_of_bounds = (
+        (stored[:, 0] < 0)
+        | (stored[:, 1] < 0)
+        | (stored[:, 0] + stored[:, 2] > image_info["width"])
+        | (stored[:, 1] + stored[:, 3] > image_info["height"])
+    )
+    for i in np.flatnonzero(out_of_bounds):
+        issue("bbox_out_of_bounds", [ids[i]], bbox=stored[i].tolist())
+
+    if len(rles) > 1:
+        iou = np.asarray(mask_utils.iou(rles, rles, [0] * len(rles)))
+        # intersection from IoU: I = iou * (A + B) / (1 + iou)
+        area_sum = areas[:, None] + areas[None, :]
+        intersection = iou * area_sum / (1 + iou)
+        smaller = np.minimum(areas[:, None], areas[None, :])
+        contained = np.divide(
+            intersection, smaller, out=np.zeros_like(intersection), where=smaller > 0
+        )
+        rows, cols = np.triu_indices(len(rles), k=1)
+        for i, j in zip(rows, cols):
+            pair = [ids[i], ids[j]]
+            same_category = bool(categories[i] == categories[j])
+            if iou[i, j] >= thresholds["duplicate_iou"]:
+                issue("duplicate", pair, iou=float(iou[i, j]), same_category=same_category)
+            elif iou[i, j] >= thresholds["overlap_iou"]:
+                issue("overlap", pair, iou=float(iou[i, j]), same_category=same_category)
+            elif contained[i, j] >= thresholds["contained_fraction"]:
+                issue("contained", pair, fraction=float(contained[i, j]))
+
+    features = [
+        (image_name, ids[i], int(categories[i]), float(areas[i]), float(bboxes[i][2]), float(bboxes[i][3]))
+        for i in range(len(annotations))
+    ]
+    return issues, features
+
+
+def _check_image_args(args):
+    return check_image(*args)
+
+
+def robust_z(values):
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    if mad == 0:
+        return np.zeros_like(values)
+    return 0.6745 * (values - median) / mad
+
+
+def find_outliers(features, categories, threshold):
+    """
+    Flags annotations whose area or bbox aspect ratio is far from the rest of
+    their category, vectorized over the whole dataset.
+    """
+    if not features:
+        return []
+    image_names = [f[0] for f in features]
+    ids = np.array([f[1] for f in features])
+    category_ids = np.array([f[2] for f in features])
+    values = np.array([f[3:] for f in features], dtype=np.float64)
+    log_area = np.log1p(values[:, 0])
+    log_aspect = np.log((values[:, 1] + 1) / (values[:, 2] + 1))
+    issues = []
+    for category_id in np.unique(category_ids):
+        members = np.flatnonzero((category_ids == category_id) & (values[:, 0] > 0))
+        if len(members) < 10:
+            continue
+        for kind, feature in (("area_outlier", log_area), ("aspect_outlier", log_aspect)):
+            z = robust_z(feature[members])
+            for k in np.flatnonzero(np.abs(z) > threshold):
+                i = members[k]
+                issues.append(
+                    dict(
+                        image=image_names[i],
+                        type=kind,
+                        annotations=[int(ids[i])],
+                        category=categories[category_id],
+                        z=float(z[k]),
+                    )
+                )
+    return issues
+
+
+def run_qa(dataset, thresholds=None, workers=None, chunksize=64):
+    thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    jobs = [(name, info, thresholds) for name, info in dataset["images"].items()]
+    issues, features = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for image_issues, image_features in executor.map(
+            _check_image_args, jobs, chunksize=chunksize
+        ):
+            issues.extend(image_issues)
+            features.extend(image_features)
+    issues.extend(find_outliers(features, dataset["categories"], thresholds["outlier_z"]))
+    return {
+        "thresholds": thresholds,
+        "num_images": len(dataset["images"]),
+        "num_annotations": len(features),
+        "summary": dict(Counter(i["type"] for i in issues)),
+        "issues": issues,
+    }
+
+
+def apply_fixes(dataset, report, remove_tiny=False):
+    """
+    Removes empty masks, merges same-category duplicates into the first
+    annotation (union of both masks) and optionally removes tiny fragments.
+    Overlaps, cross-category duplicates and outliers need a human and are
+    left alone. Returns the number of annotations removed.
+    """
+    to_remove = {}
+    to_merge = {}
+    for issue in report["issues"]:
+        removed = to_remove.setdefault(issue["image"], set())
+        if issue["type"] == "empty" or (issue["type"] == "tiny" and remove_tiny):
+            removed.update(issue["annotations"])
+        elif issue["type"] == "duplicate" and issue["same_category"]:
+            keep, duplicate = issue["annotations"]
+            if keep in removed or duplicate in removed:
+                continue
+            removed.add(duplicate)
+            to_merge.setdefault((issue["image"], keep), []).append(duplicate)
+
+    num_removed = 0
+    for image_name, removed in to_remove.items():
+        if not removed:
+            continue
+        image_info = dataset["images"][image_name]
+        by_id = {a["id"]: a for a in image_info["annotations"]}
+        for (merge_image, keep), duplicates in to_merge.items():
+            if merge_image != image_name:
+                continue
+            annotation = by_id[keep]
+            rles = [as_rle(by_id[i]["segmentation"]) for i in [keep] + duplicates]
+            merged = mask_utils.merge(rles)
+            x, y, w, h = mask_utils.toBbox(merged)
+            merged["counts"] = str(merged["counts"], "utf-8")
+            annotation["segmentation"] = merged
+            annotation["bbox"] = [float(x), float(y), float(w), float(h)]
+            annotation["area"] = float(w * h)
+        before = len(image_info["annotations"])
+        image_info["annotations"] = [a for a in image_info["annotations"] if a["id"] not in removed]
+        num_removed += before - len(image_info["annotations"])
+    return num_removed
@@ -0,0 +1,272 @@
+import cv2
+import numpy as np
+from pycocotools import mask as mask_utils
+
+from salt.utils import get_preprocess_shape
+
+
+def rle_counts(counts):
+    """
+    Uncompressed run lengths of a COCO compressed counts string (the inverse
+    of rleToString in pycocotools' maskApi.c).
+    """
+    if isinstance(counts, str):
+        counts = counts.encode("ascii")
+    runs = []
+    p = 0
+    while p < len(counts):
+        x, k, more = 0, 0, True
+        while more:
+            c = counts[p] - 48
+            x |= (c & 0x1F) << (5 * k)
+            more = c & 0x20
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(runs) > 2:
+            x += runs[-2]
+        runs.append(x)
+    return np.array(runs, dtype=np.int64)
+
+
+class RoiMask:
+    """
+    A binary mask of a full frame stored as the crop that can contain it, so
+    upsampling, encoding and blending cost scales with the object, not the
+    image. (x0, y0) is the crop's top-left corner in the frame.
+    """
+
+    def __init__(self, crop, x0, y0, height, width):
+        self.crop = crop
+        self.x0 = x0
+        self.y0 = y0
+        self.height = height
+        self.width = width
+
+    @classmethod
+    def empty(cls, height, width):
+        return cls(np.zeros((0, 0), dtype=bool), 0, 0, height, width)
+
+    @classmethod
+    def from_full(cls, mask):
+        return cls(mask.astype(bool), 0, 0, mask.shape[0], mask.shape[1]).tight()
+
+    @classmethod
+    def from_rle(cls, rle, region=None):
+        """
+        Decodes only the given (x0, y0, x1, y1) region of a full-frame RLE,
+        by default its bounding box, instead of the whole frame.
+        """
+        height, width = rle["size"]
+        if region is None:
+            x, y, w, h = mask_utils.toBbox(rle)
+            region = (int(x), int(y), int(x + w), int(y + h))
+        x0, y0, x1, y1 = region
+        if x1 <= x0 or y1 <= y0:
+            return cls.empty(height, width)
+        counts = rle["counts"]
+        counts = np.asarray(counts) if isinstance(counts, list) else rle_counts(counts)
+        boundaries = np.cumsum(counts)
+        ends = boundaries[1::2]
+        starts = boundaries[0::2][: len(ends)]
+        # runs clipped to the columns of the region, then rasterized by a
+        # running sum over +1 at each start and -1 at each end
+        lo, hi = x0 * height, x1 * height
+        starts, ends = np.clip(starts, lo, hi) - lo, np.clip(ends, lo, hi) - lo
+        keep = starts < ends
+        edges = np.zeros(hi - lo + 1, dtype=np.int8)
+        edges[starts[keep]] += 1
+        edges[ends[keep]] -= 1
+        strip = np.cumsum(edges[:-1], dtype=np.int8).astype(bool)
+        crop = strip.reshape(x1 - x0, height).T[y0:y1]
+        return cls(np.ascontiguousarray(crop), x0, y0, height, width)
+
+    @classmethod
+    def from_logits(cls, low_res_logits, image_shape, threshold=0.0, margin=2):
+        """
+        Upsamples 256x256 SAM logits (padded 1024 input frame) to the original
+        image size, but only inside the region where they can exceed threshold.
+        """
+        height, width = image_shape
+        new_h, new_w = get_preprocess_shape(height, width, 1024)
+        # the part of the low-res grid covering the image, padding excluded
+        grid_h, grid_w = new_h / 4, new_w / 4
+        valid = low_res_logits[: int(np.ceil(grid_h)), : int(np.ceil(grid_w))]
+        rows = np.flatnonzero((valid > threshold).any(axis=1))
+        cols = np.flatnonzero((valid > threshold).any(axis=0))
+        if len(rows) == 0:
+            return cls.empty(height, width)
+
+        scale_y, scale_x = height / grid_h, width / grid_w
+        r0, r1 = max(rows[0] - margin, 0), rows[-1] + 1 + margin
+        c0, c1 = max(cols[0] - margin, 0), cols[-1] + 1 + margin
+        y0, y1 = int(r0 * scale_y), min(height, int(np.ceil(r1 * scale_y)))
+        x0, x1 = int(c0 * scale_x), min(width, int(np.ceil(c1 * scale_x)))
+
+        # bilinear sampling with pixel centres aligned (align_corners=False)
+        map_x = ((np.arange(x0, x1, dtype=np.float32) + 0.5) / scale_x - 0.5)
+        map_y = ((np.arange(y0, y1, dtype=np.float32) + 0.5) / scale_y - 0.5)
+        map_x, map_y = np.meshgrid(map_x, map_y)
+        crop_logits = cv2.remap(
+            np.ascontiguousarray(low_res_logits, dtype=np.float32),
+            map_x,
+            map_y,
+            interpolation=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
+        return cls(crop_logits > threshold, x0, y0, height, width)
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+    def is_empty(self):
+        return not self.crop.any()
+
+    def tight(self):
+        """
+        Shrinks the crop to the bounding box of the mask.
+        """
+        rows = np.flatnonzero(self.crop.any(axis=1))
+        cols = np.flatnonzero(self.crop.any(axis=0))
+        if len(rows) == 0:
+            return RoiMask.empty(self.height, self.width)
+        crop = self.crop[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+        return RoiMask(crop, self.x0 + cols[0], self.y0 + rows[0], self.height, self.width)
+
+    def bbox(self):
+        tight = self.tight()
+        h, w = tight.crop.shape
+        return [float(tight.x0), float(tight.y0), float(w), float(h)]
+
+    def copy(self):
+        return RoiMask(self.crop.copy(), self.x0, self.y0, self.height, self.width)
+
+    def window(self, x0, y0, x1, y1):
+        """
+        The part of the mask inside the (x0, y0, x1, y1) region, in the
+        region's coordinates.
+        """
+        h, w = self.crop.shape
+        cx0, cy0 = max(x0, self.x0), max(y0, self.y0)
+        cx1, cy1 = min(x1, self.x0 + w), min(y1, self.y0 + h)
+        if cx1 <= cx0 or cy1 <= cy0:
+            return RoiMask.empty(y1 - y0, x1 - x0)
+        crop = self.crop[cy0 - self.y0 : cy1 - self.y0, cx0 - self.x0 : cx1 - self.x0]
+        return RoiMask(crop, cx0 - x0, cy0 - y0, y1 - y0, x1 - x0)
+
+    def expand(self, x0, y0, x1, y1):
+        """
+        Grows the crop, in place, to also cover the (x0, y0, x1, y1) region.
+        """
+        h, w = self.crop.shape
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1), min(self.height, y1)
+        if h and w:
+            x0, y0 = min(x0, self.x0), min(y0, self.y0)
+            x1, y1 = max(x1, self.x0 + w), max(y1, self.y0 + h)
+        if h and w and (x0, y0, x1, y1) == (self.x0, self.y0, self.x0 + w, self.y0 + h):
+            return
+        crop = np.zeros((y1 - y0, x1 - x0), dtype=bool)
+        crop[self.y0 - y0 : self.y0 - y0 + h, self.x0 - x0 : self.x0 - x0 + w] = self.crop
+        self.crop, self.x0, self.y0 = crop, x0, y0
+
+    def paint(self, start, end, radius, value=True):
+        """
+        Draws (or with value=False erases) a round-capped line of the given
+        radius from start to end, in place. Returns the (x0, y0, x1, y1)
+        region of the frame it can have changed.
+        """
+        (xa, ya), (xb, yb) = start, end
+        # opencv's thick lines can spill a pixel past the radius
+        reach = radius + 2
+        region = (
+            max(0, min(xa, xb) - reach),
+            max(0, min(ya, yb) - reach),
+            min(self.width, max(xa, xb) + reach + 1),
+            min(self.height, max(ya, yb) + reach + 1),
+        )
+        x0, y0, x1, y1 = region
+        if x1 <= x0 or y1 <= y0:
+            return region
+        # rasterized on its own canvas: opencv clips lines to the canvas
+        # before drawing, which would make the result depend on the crop
+        stroke = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.line(
+            stroke,
+            (int(xa - x0), int(ya - y0)),
+            (int(xb - x0), int(yb - y0)),
+            1,
+            thickness=2 * radius + 1,
+        )
+        if value:
+            self.expand(*region)
+        target = self.window(x0, y0, x1, y1)
+        h, w = target.crop.shape
+        if h == 0 or w == 0:
+            return region
+        stroke = stroke[target.y0 : target.y0 + h, target.x0 : target.x0 + w].astype(bool)
+        if value:
+            target.crop |= stroke
+        else:
+            target.crop &= ~stroke
+        return region
+
+    def area(self):
+        return int(self.crop.sum())
+
+    def overlap(self, other):
+        """
+        The number of pixels set in both masks.
+        """
+        h, w = other.crop.shape
+        ours = self.window(other.x0, other.y0, other.x0 + w, other.y0 + h)
+        oh, ow = ours.crop.shape
+        if oh == 0 or ow == 0:
+            return 0
+        theirs = other.crop[ours.y0 : ours.y0 + oh, ours.x0 : ours.x0 + ow]
+        return int(np.count_nonzero(ours.crop & theirs))
+
+    def to_full(self):
+        mask = np.zeros(self.shape, dtype=bool)
+        h, w = self.crop.shape
+        mask[self.y0 : self.y0 + h, self.x0 : self.x0 + w] = self.crop
+        return mask
+
+    def to_rle(self):
+        """
+        Encodes the mask as compressed full-frame COCO RLE, touching only the crop.
+        """
+        height, width = self.shape
+        crop_h, crop_w = self.crop.shape
+        if crop_h == 0 or crop_w == 0:
+            counts = [height * width]
+        else:
+            # COCO RLE is column-major. A zero row above and below each crop
+            # column keeps runs from spanning columns, so every run maps
+            # to a contiguous stretch of the full frame.
+            columns = np.zeros((crop_w, crop_h + 2), dtype=np.int8)
+            columns[:, 1:-1] = self.crop.T
+            changes = np.diff(columns.ravel())
+            starts = np.flatnonzero(changes == 1) + 1
+            ends = np.flatnonzero(changes == -1) + 1
+
+            def to_frame(index):
+                column, row = np.divmod(index, crop_h + 2)
+                return (self.x0 + column) * height + self.y0 + row - 1
+
+            starts, ends = to_frame(starts), to_frame(ends)
+            # runs touching the bottom and top of consecutive full-height columns join up
+            split = starts[1:] != ends[:-1]
+            starts = np.concatenate([starts[:1], starts[1:][split]])
+            ends = np.concatenate([ends[:-1][split], ends[-1:]])
+            boundaries = np.empty(2 * len(starts), dtype=np.int64)
+            boundaries[0::2] = starts
+            boundaries[1::2] = ends
+            counts = np.diff(boundaries, prepend=0, append=height * width).tolist()
+            if counts[-1] == 0:
+                counts.pop()
+        return mask_utils.frPyObjects(
+            {"counts": counts, "size": [height, width]}, height, width
+        )
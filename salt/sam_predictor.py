@@ -0,0 +1,113 @@
+import numpy as np
+import torch
+from segment_anything_hq import SamPredictor
+
+
+class RoiSamPredictor(SamPredictor):
+    """
+    SamPredictor that can stop at the low-res logits, so the caller upsamples
+    only the region the object covers (see salt.rle.RoiMask).
+    """
+
+    @torch.no_grad()
+    def predict_low_res(
+        self,
+        point_coords=None,
+        point_labels=None,
+        box=None,
+        mask_input=None,
+        multimask_output=False,
+    ):
+        if not self.is_image_set:
+            raise RuntimeError("An image must be set with .set_image(...) before mask prediction.")
+
+        # prompt handling as in SamPredictor.predict
+        points, box_torch, mask_input_torch = None, None, None
+        if point_coords is not None:
+            point_coords = self.transform.apply_coords(point_coords, self.original_size)
+            coords_torch = torch.as_tensor(point_coords, dtype=torch.float, device=self.device)
+            labels_torch = torch.as_tensor(point_labels, dtype=torch.int, device=self.device)
+            points = (coords_torch[None, :, :], labels_torch[None, :])
+        if box is not None:
+            box = self.transform.apply_boxes(box, self.original_size)
+            box_torch = torch.as_tensor(box, dtype=torch.float, device=self.device)
+            box_torch = box_torch[None, :]
+        if mask_input is not None:
+            mask_input_torch = torch.as_tensor(mask_input, dtype=torch.float, device=self.device)
+            mask_input_torch = mask_input_torch[None, :, :, :]
+
+        sparse_embeddings, dense_embeddings = self.model.prompt_encoder(
+            points=points,
+            boxes=box_torch,
+            masks=mask_input_torch,
+        )
+        if multimask_output:
+            low_res_masks, iou_predictions = self.__decode_candidates(
+                sparse_embeddings, dense_embeddings
+            )
+        else:
+            low_res_masks, iou_predictions = self.model.mask_decoder(
+                image_embeddings=self.features,
+                image_pe=self.model.prompt_encoder.get_dense_pe(),
+                sparse_prompt_embeddings=sparse_embeddings,
+                dense_prompt_embeddings=dense_embeddings,
+                multimask_output=False,
+                hq_token_only=False,
+                interm_embeddings=self.interm_features,
+            )
+        return (
+            iou_predictions[0].detach().cpu().numpy(),
+            low_res_masks[0].detach().cpu().numpy(),
+        )
+
+    def __decode_candidates(self, sparse_embeddings, dense_embeddings):
+        """
+        The three multimask candidates, each refined by the HQ mask. With
+        multimask_output=True, MaskDecoderHQ keeps only the best of them.
+        """
+        decoder = self.model.mask_decoder
+        vit_features = self.interm_features[0].permute(0, 3, 1, 2)
+        hq_features = decoder.embedding_encoder(self.features) + decoder.compress_vit_feat(
+            vit_features
+        )
+        masks, iou_predictions = decoder.predict_masks(
+            image_embeddings=self.features,
+            image_pe=self.model.prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse_embeddings,
+            dense_prompt_embeddings=dense_embeddings,
+            hq_features=hq_features,
+        )
+        # tokens 1-3 are the SAM candidates, the last one is the HQ token
+        hq_token = decoder.num_mask_tokens - 1
+        candidates = masks[:, 1:hq_token] + masks[:, hq_token : hq_token + 1]
+        return candidates, iou_predictions[:, 1:hq_token]
+
+    @torch.no_grad()
+    def predict_boxes_low_res(self, boxes):
+        """
+        One decoder call for a batch of box prompts. boxes is (B, 4) in XYXY.
+        Returns (B, 1) IoU predictions and (B, 1, 256, 256) low-res logits.
+        """
+        if not self.is_image_set:
+            raise RuntimeError("An image must be set with .set_image(...) before mask prediction.")
+
+        boxes = self.transform.apply_boxes(np.asarray(boxes), self.original_size)
+        boxes_torch = torch.as_tensor(boxes, dtype=torch.float, device=self.device)
+        sparse_embeddings, dense_embeddings = self.model.prompt_encoder(
+            points=None,
+            boxes=boxes_torch,
+            masks=None,
+        )
+        low_res_masks, iou_predictions = self.model.mask_decoder(
+            image_embeddings=self.features,
+            image_pe=self.model.prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse_embeddings,
+            dense_prompt_embeddings=dense_embeddings,
+            multimask_output=False,
+            hq_token_only=False,
+            interm_embeddings=self.interm_features,
+        )
+        return (
+            iou_predictions.detach().cpu().numpy(),
+            low_res_masks.detach().cpu().numpy(),
+        )
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+SESSIONS_DIR = "sessions"
+LEASE_TTL = 15 * 60
+ID_BLOCK_SIZE = 10000
+
+
+def atomic_write_json(path, data, indent=None):
+    # readers never see a half-written file
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(temp_path, path)
+
+
+@contextmanager
+def file_lock(lock_path, timeout=30.0, stale_after=60.0):
+    """
+    Cross-process lock based on exclusive file creation. A lock file older
+    than stale_after seconds is assumed to belong to a crashed process.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Could not acquire {lock_path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.remove(lock_path)
+
+
+def unmerged_shards(dataset_folder):
+    """
+    Session shards whose edits are not in annotations.json yet.
+    """
+    return sorted((Path(dataset_folder) / SESSIONS_DIR).glob("*.json"))
+
+
+def dataset_lock(dataset_folder):
+    """
+    The lock sessions and merges hold while writing shards or annotations.json.
+    """
+    sessions_folder = Path(dataset_folder) / SESSIONS_DIR
+    sessions_folder.mkdir(exist_ok=True)
+    return file_lock(sessions_folder / ".lock")
+
+
+def max_annotation_id(images):
+    return max(
+        (a["id"] for info in images.values() for a in info["annotations"]), default=-1
+    )
+
+
+class SessionStore:
+    """
+    One annotator's view of a shared dataset. Edits go to a shard file of the
+    session instead of the canonical annotations.json, images are leased so
+    concurrent sessions are handed disjoint work, and annotation ids come from
+    blocks handed out under a lock, so they are unique across sessions.
+
+    <dataset>/sessions/<session>.json    images this session edited
+    <dataset>/sessions/leases/*.lease    who works on which image
+    <dataset>/sessions/next_id           start of the next free id block
+    """
+
+    def __init__(self, dataset_folder, session, lease_ttl=LEASE_TTL):
+        self.session = session
+        self.lease_ttl = lease_ttl
+        self.sessions_folder = Path(dataset_folder) / SESSIONS_DIR
+        self.leases_folder = self.sessions_folder / "leases"
+        self.leases_folder.mkdir(parents=True, exist_ok=True)
+        self.shard_path = self.sessions_folder / f"{session}.json"
+        self.lock_path = self.sessions_folder / ".lock"
+        self.merged_at_path = self.sessions_folder / "merged_at"
+        self.next_id = 0
+        self.block_end = 0
+        # the shard holds every edit made before this, as far as merges are concerned
+        self.saved_at = time.time()
+
+    def shard_paths(self):
+        return unmerged_shards(self.sessions_folder.parent)
+
+    def read_shards(self):
+        """
+        The newest edit of every image across all shards, as
+        {image_name: (updated, annotations)}.
+        """
+        latest = {}
+        for path in self.shard_paths():
+            with open(path, "r") as f:
+                shard = json.load(f)
+            for image_name, entry in shard["images"].items():
+                if image_name not in latest or entry["updated"] > latest[image_name][0]:
+                    latest[image_name] = (entry["updated"], entry["annotations"])
+        return latest
+
+    def edited_images(self):
+        """
+        {image_name: time of the last edit} from this session's own shard.
+        """
+        if not self.shard_path.exists():
+            return {}
+        with open(self.shard_path, "r") as f:
+            shard = json.load(f)
+        return {image_name: entry["updated"] for image_name, entry in shard["images"].items()}
+
+    def last_merge(self):
+        try:
+            return float(self.merged_at_path.read_text())
+        except FileNotFoundError:
+            return 0.0
+
+    def write_shard(self, images, updated):
+        """
+        images: {image_name: annotations} of every image this session edited,
+        updated: {image_name: time of the last edit}.
+        Returns the images a merge took since the last write. They are in the
+        canonical file now and their leases are gone, so they are left out.
+        """
+        with file_lock(self.lock_path):
+            merged = set()
+            if self.last_merge() > self.saved_at:
+                merged = {
+                    image_name
+                    for image_name in images
+                    if updated[image_name] <= self.saved_at
+                }
+            shard = {
+                "session": self.session,
+                "images": {
+                    image_name: {"updated": updated[image_name], "annotations": annotations}
+                    for image_name, annotations in images.items()
+                    if image_name not in merged
+                },
+            }
+            atomic_write_json(self.shard_path, shard)
+            self.saved_at = time.time()
+        return merged
+
+    def allocate_id(self, images):
+        if self.next_id >= self.block_end:
+            self.next_id, self.block_end = self.__allocate_id_block(images)
+        annotation_id = self.next_id
+        self.next_id += 1
+        return annotation_id
+
+    def __allocate_id_block(self, images):
+        next_id_path = self.sessions_folder / "next_id"
+        with file_lock(self.lock_path):
+            start = max_annotation_id(images) + 1
+            if next_id_path.exists():
+                start = max(start, int(next_id_path.read_text()))
+            next_id_path.write_text(str(start + ID_BLOCK_SIZE))
+        return start, start + ID_BLOCK_SIZE
+
+    def __lease_path(self, image_name):
+        digest = hashlib.sha1(image_name.encode("utf-8")).hexdigest()
+        return self.leases_folder / f"{digest}.lease"
+
+    def lease_holder(self, image_name):
+        """
+        The session holding a live lease on the image, or None.
+        """
+        path = self.__lease_path(image_name)
+        try:
+            with open(path, "r") as f:
+                lease = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if lease["expires"] is not None and lease["expires"] < time.time():
+            return None
+        return lease["session"]
+
+    def acquire(self, image_name, keep=False):
+        """
+        Takes or renews the lease on an image. keep holds it until the image is
+        merged, for images this session edited. Returns the holding session
+        if another one has it, else None.
+        """
+        with file_lock(self.lock_path):
+            holder = self.lease_holder(image_name)
+            if holder is not None and holder != self.session:
+                return holder
+            expires = None if keep else time.time() + self.lease_ttl
+            atomic_write_json(
+                self.__lease_path(image_name),
+                {"session": self.session, "image": image_name, "expires": expires},
+            )
+        return None
+
+    def release(self, image_name):
+        path = self.__lease_path(image_name)
+        with file_lock(self.lock_path):
+            if self.lease_holder(image_name) == self.session:
+                path.unlink()
+
+
+def merge_sessions(dataset_folder, dataset_json_path, archive=True):
+    """
+    Folds every session shard into the canonical annotations file, newest edit
+    per image winning, and renumbers any annotation ids that collide. Merged
+    shards are moved to sessions/merged and the leases of merged images are
+    dropped. Returns (images merged, ids renumbered).
+    """
+    store = SessionStore(dataset_folder, "merge")
+    with file_lock(store.lock_path):
+        with open(dataset_json_path, "r") as f:
+            dataset = json.load(f)
+        shard_paths = store.shard_paths()
+        latest = store.read_shards()
+        for image_name, (_, annotations) in latest.items():
+            dataset["images"][image_name]["annotations"] = annotations
+
+        seen = set()
+        next_id = max_annotation_id(dataset["images"]) + 1
+        next_id_path = store.sessions_folder / "next_id"
+        if next_id_path.exists():
+            next_id = max(next_id, int(next_id_path.read_text()))
+        renumbered = 0
+        for image_info in dataset["images"].values():
+            for annotation in image_info["annotations"]:
+                if annotation["id"] in seen:
+                    annotation["id"] = next_id
+                    next_id += 1
+                    renumbered += 1
+                seen.add(annotation["id"])
+        next_id_path.write_text(str(next_id))
+
+        atomic_write_json(dataset_json_path, dataset, indent=4)
+
+        merged_folder = store.sessions_folder / "merged"
+        merged_folder.mkdir(exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        for path in shard_paths:
+            if archive:
+                os.replace(path, merged_folder / f"{path.stem}.{stamp}.json")
+            else:
+                path.unlink()
+        for lease_path in store.leases_folder.glob("*.lease"):
+            try:
+                with open(lease_path, "r") as f:
+                    lease = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            if lease["expires"] is None and lease["image"] in latest:
+                lease_path.unlink()
+        # running sessions stop writing what was merged on their next save
+        store.merged_at_path.write_text(repr(time.time()))
+    return len(latest), renumbered
@@ -0,0 +1,196 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+INDEX_NAME = "similarity_index.npz"
+DUPLICATE_SIMILARITY = 0.98
+
+
+def pool_embedding(embedding):
+    """
+    Global descriptor of a (1, 256, 64, 64) SAM embedding: per-channel mean
+    and standard deviation over the grid.
+    """
+    embedding = np.asarray(embedding, dtype=np.float32).reshape(embedding.shape[-3], -1)
+    return np.concatenate([embedding.mean(axis=1), embedding.std(axis=1)])
+
+
+def load_descriptor(embedding_path):
+    try:
+        embedding = np.load(embedding_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return pool_embedding(embedding)
+
+
+def embedding_path(embeddings_folder, image_name):
+    return Path(embeddings_folder) / (Path(image_name).stem + ".npy")
+
+
+class SimilarityIndex:
+    """
+    Cosine k-NN over pooled embedding descriptors. Descriptors are stored as
+    float16 (100k images take ~100MB) and compared in float32 row chunks, so
+    queries are a few matrix products rather than a loop over images.
+    Descriptors are centered on the dataset mean before normalizing, otherwise
+    what all SAM embeddings share makes every pair look alike.
+    """
+
+    def __init__(self, names, descriptors, mtimes=None):
+        self.names = list(names)
+        self.rows = {name: row for row, name in enumerate(self.names)}
+        self.descriptors = np.asarray(descriptors, dtype=np.float16)
+        self.mtimes = np.zeros(len(self.names)) if mtimes is None else np.asarray(mtimes)
+        self.__matrix = None
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["names"].tolist(), data["descriptors"], data["mtimes"])
+
+    def save(self, path):
+        tmp_path = str(path) + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            names=np.array(self.names, dtype=str),
+            descriptors=self.descriptors,
+            mtimes=self.mtimes,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def build(cls, image_names, embeddings_folder, previous=None, workers=None):
+        """
+        Pools the stored embeddings of image_names. Descriptors of a previous
+        index are reused when the embedding file has not changed since.
+        Images without an embedding are left out.
+        """
+        names, descriptors, mtimes, todo = [], [], [], []
+        for image_name in image_names:
+            path = embedding_path(embeddings_folder, image_name)
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if previous is not None and image_name in previous.rows:
+                row = previous.rows[image_name]
+                if previous.mtimes[row] == mtime:
+                    names.append(image_name)
+                    descriptors.append(previous.descriptors[row])
+                    mtimes.append(mtime)
+                    continue
+            todo.append((image_name, path, mtime))
+        # reading the files dominates and releases the GIL, so threads are enough
+        with ThreadPoolExecutor(workers) as executor:
+            pooled = executor.map(load_descriptor, [path for _, path, _ in todo])
+            for (image_name, _, mtime), descriptor in zip(todo, pooled):
+                if descriptor is None:
+                    continue
+                names.append(image_name)
+                descriptors.append(descriptor)
+                mtimes.append(mtime)
+        if not descriptors:
+            return cls([], np.zeros((0, 512), dtype=np.float16))
+        return cls(names, np.stack(descriptors), mtimes)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, image_name):
+        return image_name in self.rows
+
+    def matrix(self):
+        if self.__matrix is None:
+            matrix = self.descriptors.astype(np.float32)
+            matrix -= matrix.mean(axis=0)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.maximum(norms, 1e-12)
+            self.__matrix = matrix
+        return self.__matrix
+
+    def __chunk_rows(self, budget=1 << 25):
+        # keeps each chunk's similarity block around 128MB
+        return max(1, budget // max(1, len(self)))
+
+    def knn(self, rows, k=10):
+        """
+        The k most similar other images for each row, as (rows x k) arrays of
+        neighbor rows and similarities, most similar first.
+        """
+        matrix = self.matrix()
+        rows = np.atleast_1d(rows)
+        k = min(k, len(self) - 1)
+        neighbors = np.empty((len(rows), k), dtype=np.int64)
+        similarities = np.empty((len(rows), k), dtype=np.float32)
+        if k <= 0:
+            return neighbors, similarities
+        step = self.__chunk_rows()
+        for start in range(0, len(rows), step):
+            chunk = rows[start : start + step]
+            block = matrix[chunk] @ matrix.T
+            block[np.arange(len(chunk)), chunk] = -np.inf
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_similarities = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_similarities, axis=1)
+            neighbors[start : start + step] = np.take_along_axis(top, order, axis=1)
+            similarities[start : start + step] = np.take_along_axis(
+                top_similarities, order, axis=1
+            )
+        return neighbors, similarities
+
+    def neighbors(self, image_name, k=10):
+        """
+        (image name, similarity) of the k images most similar to image_name.
+        """
+        if image_name not in self.rows:
+            return []
+        neighbors, similarities = self.knn(self.rows[image_name], k)
+        return [
+            (self.names[row], float(similarity))
+            for row, similarity in zip(neighbors[0], similarities[0])
+        ]
+
+    def near_duplicates(self, threshold=DUPLICATE_SIMILARITY):
+        """
+        All pairs (name_a, name_b, similarity) at or above threshold, each once.
+        """
+        matrix = self.matrix()
+        pairs = []
+        step = self.__chunk_rows()
+        for start in range(0, len(self), step):
+            # only compare against later rows, the upper triangle covers every pair
+            block = matrix[start : start + step] @ matrix[start:].T
+            rows, cols = np.nonzero(block >= threshold)
+            keep = cols > rows
+            for row, col in zip(rows[keep], cols[keep]):
+                pairs.append(
+                    (
+                        self.names[start + row],
+                        self.names[start + col],
+                        float(block[row, col]),
+                    )
+                )
+        return pairs
+
+    def duplicate_groups(self, threshold=DUPLICATE_SIMILARITY):
+        """
+        Connected groups of near-duplicates, as lists of names in index order.
+        """
+        parent = list(range(len(self)))
+
+        def find(row):
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+
+        for name_a, name_b, _ in self.near_duplicates(threshold):
+            root_a, root_b = find(self.rows[name_a]), find(self.rows[name_b])
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+        groups = {}
+        for row in range(len(self)):
+            groups.setdefault(find(row), []).append(self.names[row])
+        return [group for group in groups.values() if len(group) > 1]
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from pycocotools import mask as mask_utils
+
+from salt.rle import RoiMask
+
+
+def random_masks(seed, count=20, shape=(37, 53)):
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    for _ in range(count):
+        mask = np.zeros(shape, dtype=bool)
+        for _ in range(rng.integers(0, 4)):
+            x0, x1 = np.sort(rng.integers(0, width + 1, 2))
+            y0, y1 = np.sort(rng.integers(0, height + 1, 2))
+            mask[y0:y1, x0:x1] = True
+        # scattered pixels, including ones on the frame's edges
+        mask |= rng.random(shape) < 0.02
+        yield mask
+
+
+def coco_rle(mask):
+    return mask_utils.encode(np.asfortranarray(mask.astype(np.uint8)))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_to_rle_matches_pycocotools(seed):
+    for mask in random_masks(seed):
+        rle = RoiMask.from_full(mask).to_rle()
+        assert rle["counts"] == coco_rle(mask)["counts"]
+        assert np.array_equal(mask_utils.decode(rle).astype(bool), mask)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_from_rle_decodes_pycocotools_rle(seed):
+    for mask in random_masks(seed):
+        roi = RoiMask.from_rle(coco_rle(mask))
+        assert np.array_equal(roi.to_full(), mask)
+        # a region decodes the same pixels as cropping the full decode
+        region = (5, 3, 40, 30)
+        x0, y0, x1, y1 = region
+        window = RoiMask.from_rle(coco_rle(mask), region)
+        assert (window.x0, window.y0) == (x0, y0)
+        assert np.array_equal(window.crop, mask[y0:y1, x0:x1])
+
+
+def test_full_height_columns_round_trip():
+    mask = np.zeros((8, 6), dtype=bool)
+    mask[:, 1:4] = True
+    rle = RoiMask.from_full(mask).to_rle()
+    assert rle["counts"] == coco_rle(mask)["counts"]
+    assert np.array_equal(RoiMask.from_rle(rle).to_full(), mask)
+
+
+def test_empty_mask_round_trip():
+    rle = RoiMask.empty(8, 6).to_rle()
+    assert rle["counts"] == coco_rle(np.zeros((8, 6), dtype=bool))["counts"]
+    assert RoiMask.from_rle(rle).is_empty()
+
+
+def test_painted_mask_round_trip():
+    mask = RoiMask.empty(40, 50)
+    mask.paint((10, 10), (30, 20), 3)
+    mask.paint((20, 12), (20, 18), 2, value=False)
+    full = mask.to_full()
+    assert full.any() and not full[15, 20]
+    rle = mask.to_rle()
+    assert rle["counts"] == coco_rle(full)["counts"]
+    assert np.array_equal(RoiMask.from_rle(rle).to_full(), full)
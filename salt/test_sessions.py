@@ -0,0 +1,102 @@
+import json
+import time
+
+from salt.sessions import SessionStore, merge_sessions
+
+
+def write_dataset(dataset_folder, images):
+    path = dataset_folder / "annotations.json"
+    path.write_text(json.dumps({"images": images}))
+    return path
+
+
+def annotation(annotation_id):
+    return {"id": annotation_id, "category_id": 0}
+
+
+def test_acquire_refuses_a_live_lease(tmp_path):
+    a = SessionStore(tmp_path, "a")
+    b = SessionStore(tmp_path, "b")
+    assert a.acquire("0.jpg") is None
+    assert b.acquire("0.jpg") == "a"
+    # renewing your own lease always works
+    assert a.acquire("0.jpg") is None
+    assert a.lease_holder("0.jpg") == "a"
+
+
+def test_acquire_takes_an_expired_lease(tmp_path):
+    a = SessionStore(tmp_path, "a", lease_ttl=0.05)
+    b = SessionStore(tmp_path, "b")
+    assert a.acquire("0.jpg") is None
+    time.sleep(0.1)
+    assert a.lease_holder("0.jpg") is None
+    assert b.acquire("0.jpg") is None
+    assert a.acquire("0.jpg") == "b"
+
+
+def test_kept_lease_does_not_expire(tmp_path):
+    a = SessionStore(tmp_path, "a", lease_ttl=0.05)
+    b = SessionStore(tmp_path, "b")
+    assert a.acquire("0.jpg", keep=True) is None
+    time.sleep(0.1)
+    assert b.acquire("0.jpg") == "a"
+    a.release("0.jpg")
+    assert b.acquire("0.jpg") is None
+
+
+def test_merge_renumbers_colliding_ids(tmp_path):
+    dataset_json_path = write_dataset(
+        tmp_path,
+        {
+            "0.jpg": {"annotations": [annotation(0)]},
+            "1.jpg": {"annotations": []},
+            "2.jpg": {"annotations": []},
+        },
+    )
+    a = SessionStore(tmp_path, "a")
+    b = SessionStore(tmp_path, "b")
+    # both sessions were handed the same id, as with shards written before id blocks
+    a.write_shard({"1.jpg": [annotation(1)]}, {"1.jpg": time.time()})
+    b.write_shard({"2.jpg": [annotation(1), annotation(2)]}, {"2.jpg": time.time()})
+
+    num_images, num_renumbered = merge_sessions(tmp_path, dataset_json_path)
+
+    assert (num_images, num_renumbered) == (2, 1)
+    images = json.loads(dataset_json_path.read_text())["images"]
+    ids = [a["id"] for info in images.values() for a in info["annotations"]]
+    assert len(ids) == 4 and len(set(ids)) == 4
+    # ids handed out after the merge start past every merged one
+    assert a.allocate_id(images) > max(ids)
+
+
+def test_merge_keeps_the_newest_edit_and_drops_its_leases(tmp_path):
+    dataset_json_path = write_dataset(tmp_path, {"0.jpg": {"annotations": []}})
+    a = SessionStore(tmp_path, "a")
+    b = SessionStore(tmp_path, "b")
+    a.acquire("0.jpg", keep=True)
+    now = time.time()
+    a.write_shard({"0.jpg": [annotation(0)]}, {"0.jpg": now})
+    b.write_shard({"0.jpg": [annotation(1)]}, {"0.jpg": now - 1})
+
+    merge_sessions(tmp_path, dataset_json_path)
+
+    images = json.loads(dataset_json_path.read_text())["images"]
+    assert images["0.jpg"]["annotations"] == [annotation(0)]
+    assert a.lease_holder("0.jpg") is None
+    assert a.shard_paths() == []
+
+
+def test_write_shard_leaves_out_merged_images(tmp_path):
+    dataset_json_path = write_dataset(
+        tmp_path, {"0.jpg": {"annotations": []}, "1.jpg": {"annotations": []}}
+    )
+    a = SessionStore(tmp_path, "a")
+    edited = time.time()
+    a.write_shard({"0.jpg": [annotation(0)]}, {"0.jpg": edited})
+    merge_sessions(tmp_path, dataset_json_path)
+
+    images = {"0.jpg": [annotation(0)], "1.jpg": [annotation(1)]}
+    merged = a.write_shard(images, {"0.jpg": edited, "1.jpg": time.time()})
+
+    assert merged == {"0.jpg"}
+    assert set(a.edited_images()) == {"1.jpg"}
@@ -0,0 +1,141 @@
+from collections import OrderedDict
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QSize, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QPixmap
+from PyQt5.QtWidgets import QAbstractItemView, QListView
+
+from salt.thumbnails import THUMBNAIL_SIZE, ThumbnailCache
+
+ANNOTATED_COLOR = QColor(60, 140, 60)
+LEASED_COLOR = QColor(160, 60, 60)
+
+
+class ThumbnailModel(QAbstractListModel):
+    """
+    One row per image. Qt only asks for the rows it paints, so thumbnails and
+    statuses are looked up lazily and a few hundred pixmaps are kept in memory.
+    """
+
+    thumbnail_ready = pyqtSignal(int)
+
+    def __init__(self, editor, size=THUMBNAIL_SIZE, max_pixmaps=512):
+        super(ThumbnailModel, self).__init__()
+        self.editor = editor
+        self.dataset_explorer = editor.dataset_explorer
+        self.cache = ThumbnailCache(self.dataset_explorer, size=size)
+        self.cache.on_ready = self.thumbnail_ready.emit
+        self.thumbnail_ready.connect(self.refresh_row)
+        self.pixmaps = OrderedDict()
+        self.max_pixmaps = max_pixmaps
+        self.availability = {}
+        self.placeholder = QPixmap(size, size)
+        self.placeholder.fill(QColor(40, 40, 40))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.dataset_explorer.get_num_images()
+
+    def __pixmap(self, image_id):
+        if image_id in self.pixmaps:
+            self.pixmaps.move_to_end(image_id)
+            return self.pixmaps[image_id]
+        path = self.cache.get(image_id)
+        if path is None:
+            return self.placeholder
+        pixmap = QPixmap(str(path))
+        self.pixmaps[image_id] = pixmap
+        while len(self.pixmaps) > self.max_pixmaps:
+            self.pixmaps.popitem(last=False)
+        return pixmap
+
+    def __is_available(self, image_id):
+        # lease files are only read for painted rows, and again after refresh()
+        if image_id not in self.availability:
+            self.availability[image_id] = self.dataset_explorer.is_available(image_id)
+        return self.availability[image_id]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        image_id = index.row()
+        if role == Qt.DisplayRole:
+            num_annotations = len(self.dataset_explorer.get_annotations(image_id))
+            return f"{image_id}  ({num_annotations})"
+        if role == Qt.DecorationRole:
+            return self.__pixmap(image_id)
+        if role == Qt.ToolTipRole:
+            return self.dataset_explorer.image_paths[image_id]
+        if role == Qt.BackgroundRole:
+            if not self.__is_available(image_id):
+                return LEASED_COLOR
+            if self.dataset_explorer.get_annotations(image_id):
+                return ANNOTATED_COLOR
+        return None
+
+    def refresh_row(self, image_id):
+        self.pixmaps.pop(image_id, None)
+        index = self.index(image_id)
+        self.dataChanged.emit(index, index)
+
+    def refresh(self):
+        """
+        Re-reads counts and leases, e.g. after saving or navigating.
+        """
+        self.availability.clear()
+        self.dataChanged.emit(self.index(0), self.index(self.rowCount() - 1))
+
+
+class ThumbnailGrid(QListView):
+    """
+    Virtualized grid of thumbnails: clicking one jumps to it, resting on one warms
+    the image cache so the jump finds the frame decoded.
+    """
+
+    image_selected = pyqtSignal(int)
+
+    def __init__(self, editor, size=THUMBNAIL_SIZE, hover_delay_ms=300):
+        super(ThumbnailGrid, self).__init__()
+        self.editor = editor
+        self.thumbnails = ThumbnailModel(editor, size=size)
+        self.setModel(self.thumbnails)
+        self.setViewMode(QListView.IconMode)
+        self.setIconSize(QSize(size, size))
+        self.setGridSize(QSize(size + 16, size + 32))
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        # uniform sizes let the view lay out 100k rows without asking for their data
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(256)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setMouseTracking(True)
+        # warms the image the cursor rests on, not every one it crosses
+        self.hovered = None
+        self.hover_timer = QTimer(self)
+        self.hover_timer.setSingleShot(True)
+        self.hover_timer.setInterval(hover_delay_ms)
+        self.hover_timer.timeout.connect(self.warm_hovered)
+        self.entered.connect(self.hover)
+        self.clicked.connect(lambda index: self.image_selected.emit(index.row()))
+        self.activated.connect(lambda index: self.image_selected.emit(index.row()))
+
+    def hover(self, index):
+        self.hovered = index.row()
+        self.hover_timer.start()
+
+    def leaveEvent(self, event):
+        self.hover_timer.stop()
+        super(ThumbnailGrid, self).leaveEvent(event)
+
+    def warm_hovered(self):
+        self.editor.warm_image(self.hovered)
+
+    def show_current(self):
+        self.thumbnails.refresh()
+        index = self.thumbnails.index(self.editor.image_id)
+        self.setCurrentIndex(index)
+        self.scrollTo(index, QAbstractItemView.PositionAtCenter)
+
+    def shutdown(self):
+        self.thumbnails.cache.shutdown()
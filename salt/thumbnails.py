@@ -0,0 +1,133 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+
+from salt.image_loader import REDUCED_FLAGS, reduce_factor_for
+
+THUMBNAILS_DIR = ".thumbnails"
+THUMBNAIL_SIZE = 160
+
+
+def thumbnail_name(image_name):
+    return hashlib.sha1(str(image_name).encode("utf-8")).hexdigest() + ".jpg"
+
+
+def make_thumbnail(image_path, thumbnail_path, size, image_size):
+    """
+    Worker: writes a JPEG whose long side is size. The image is decoded with
+    IMREAD_REDUCED_* when it is large enough, which skips most of the work.
+    """
+    factor = reduce_factor_for(*image_size, size)
+    image = cv2.imread(image_path, REDUCED_FLAGS[factor])
+    if image is None:
+        return False
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale < 1:
+        image = cv2.resize(
+            image,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+    tmp_path = thumbnail_path + ".tmp.jpg"
+    cv2.imwrite(tmp_path, image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    os.replace(tmp_path, thumbnail_path)
+    return True
+
+
+class ThumbnailCache:
+    """
+    Thumbnails under <dataset>/.thumbnails, generated on demand by a process
+    pool. A thumbnail older than its image is generated again. Requests are
+    served newest first, so rows that just scrolled into view come before
+    the ones scrolled past.
+    """
+
+    def __init__(self, dataset_explorer, size=THUMBNAIL_SIZE, workers=None, max_queued=1024):
+        self.dataset_explorer = dataset_explorer
+        self.size = size
+        # created with the first thumbnail, sessions that never show the grid leave no trace
+        self.cache_dir = Path(dataset_explorer.dataset_folder) / THUMBNAILS_DIR
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_queued = max_queued
+        self.executor = None
+        self.queue = OrderedDict()
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        # called with the image id, from a pool thread, once a thumbnail is written
+        self.on_ready = None
+
+    def __paths(self, image_id):
+        image_name = self.dataset_explorer.image_paths[image_id]
+        image_path = Path(self.dataset_explorer.dataset_folder) / image_name
+        return image_path, self.cache_dir / thumbnail_name(image_name)
+
+    def get(self, image_id):
+        """
+        Path of the image's thumbnail if it is up to date, else None, in which
+        case it is queued for generation.
+        """
+        image_path, thumbnail_path = self.__paths(image_id)
+        try:
+            if thumbnail_path.stat().st_mtime >= image_path.stat().st_mtime:
+                return thumbnail_path
+        except FileNotFoundError:
+            pass
+        self.request(image_id)
+        return None
+
+    def request(self, image_id):
+        with self.lock:
+            if image_id in self.in_flight:
+                return
+            self.queue[image_id] = None
+            self.queue.move_to_end(image_id)
+            while len(self.queue) > self.max_queued:
+                self.queue.popitem(last=False)
+        self.__pump()
+
+    def __pump(self):
+        # a bounded window keeps the newest requests from waiting behind old ones
+        while True:
+            with self.lock:
+                if not self.queue or len(self.in_flight) >= 2 * self.workers:
+                    return
+                image_id, _ = self.queue.popitem(last=True)
+                self.in_flight.add(image_id)
+                if self.executor is None:
+                    self.cache_dir.mkdir(exist_ok=True)
+                    # hover warming and the grid's threads are running by now,
+                    # fork would copy them into the workers
+                    self.executor = ProcessPoolExecutor(
+                        self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+            image_path, thumbnail_path = self.__paths(image_id)
+            future = self.executor.submit(
+                make_thumbnail,
+                str(image_path),
+                str(thumbnail_path),
+                self.size,
+                self.dataset_explorer.get_image_size(image_id),
+            )
+            future.add_done_callback(lambda f, image_id=image_id: self.__done(image_id, f))
+
+    def __done(self, image_id, future):
+        with self.lock:
+            self.in_flight.discard(image_id)
+        ready = not future.cancelled() and future.exception() is None and future.result()
+        if ready and self.on_ready is not None:
+            self.on_ready(image_id)
+        self.__pump()
+
+    def shutdown(self):
+        with self.lock:
+            self.queue.clear()
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
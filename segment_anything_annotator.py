@@ -1,17 +1,42 @@
 import argparse
 import sys
 import warnings
+from functools import partial
 from pathlib import Path
 
-with warnings.catch_warnings():
-    warnings.filterwarnings("ignore", category=UserWarning)
-    from segment_anything_hq import sam_model_registry
-
 from PyQt5.QtWidgets import QApplication
 
 from salt.editor import Editor
 from salt.interface import ApplicationInterface
-        
+from salt.model_loader import ModelLoader
+from salt.profiling import profiler
+
+
+def load_model(args):
+    # heavy imports happen here, on the loader thread, after the window is up
+    if args.onnx_models_path is not None:
+        from salt.onnx_model import OnnxSam
+
+        return OnnxSam(args.onnx_models_path, quantized=not args.no_quantized_encoder)
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=UserWarning)
+        from segment_anything_hq import sam_model_registry
+
+    sam = sam_model_registry[args.model_type](checkpoint=args.checkpoint_path)
+    sam.to(device=args.device)
+    return sam
+
+
+def start_model(args):
+    if args.worker:
+        from salt.inference_worker import InferenceWorker
+
+        # the worker process runs load_model itself
+        return InferenceWorker(partial(load_model, args))
+    return load_model(args)
+
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
@@ -20,6 +45,41 @@ if __name__ == "__main__":
     parser.add_argument("--device", type=str, default="cuda")
     parser.add_argument("--dataset-path", type=str, default="./dataset")
     parser.add_argument("--categories", type=str)
+    parser.add_argument(
+        "--onnx-models-path",
+        type=str,
+        default=None,
+        help="run the encoder and decoder with ONNX Runtime on CPU instead of torch",
+    )
+    parser.add_argument("--no-quantized-encoder", action="store_true")
+    parser.add_argument("--profile", action="store_true", help="collect timing spans")
+    parser.add_argument(
+        "--trace-path",
+        type=str,
+        default=None,
+        help="write collected spans as Chrome trace-event JSON on exit",
+    )
+    parser.add_argument(
+        "--session",
+        type=str,
+        default=None,
+        help="annotator name; edits go to a session shard merged with merge_sessions.py",
+    )
+    parser.add_argument(
+        "--sequence",
+        action="store_true",
+        help="images are video frames: propose the previous frame's annotations on the next",
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="run the model in a separate process that is restarted if it crashes",
+    )
+    parser.add_argument(
+        "--review",
+        action="store_true",
+        help="browse and fix annotations without loading a model",
+    )
     args = parser.parse_args()
 
     dataset_path = Path(args.dataset_path)
@@ -29,17 +89,31 @@ if __name__ == "__main__":
 
     dataset_json_path = dataset_path / "annotations.json"
 
-    sam = sam_model_registry[args.model_type](checkpoint=args.checkpoint_path)
-    sam.to(device=args.device)
+    if args.profile or args.trace_path is not None:
+        profiler.enabled = True
+
+    app = QApplication(sys.argv)
 
     editor = Editor(
-        sam,
+        None,
         dataset_path,
         categories=categories,
-        dataset_json_path=dataset_json_path
+        dataset_json_path=dataset_json_path,
+        session=args.session,
     )
+    editor.sequence_mode = args.sequence
 
-    app = QApplication(sys.argv)
-    window = ApplicationInterface(app, editor)
+    window = ApplicationInterface(app, editor, review_mode=args.review)
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+
+    if not args.review:
+        loader = ModelLoader(editor, partial(start_model, args))
+        loader.progress.connect(window.set_model_status)
+        loader.loaded.connect(window.model_loaded)
+        loader.failed.connect(window.model_failed)
+        loader.start()
+
+    exit_code = app.exec_()
+    if args.trace_path is not None:
+        profiler.export_chrome_trace(args.trace_path)
+    sys.exit(exit_code)
\ No newline at end of file
@@ -0,0 +1,49 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+from salt.similarity import DUPLICATE_SIMILARITY, INDEX_NAME, SimilarityIndex
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset-path", type=str, default="./dataset")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--duplicate-similarity",
+        type=float,
+        default=DUPLICATE_SIMILARITY,
+        help="cosine similarity at which two frames count as near-duplicates",
+    )
+    parser.add_argument("--rebuild", action="store_true", help="pool every embedding again")
+    args = parser.parse_args()
+
+    dataset_path = Path(args.dataset_path)
+    index_path = dataset_path / INDEX_NAME
+    with open(dataset_path / "annotations.json", "r") as f:
+        image_names = list(json.load(f)["images"])
+
+    previous = None
+    if index_path.exists() and not args.rebuild:
+        previous = SimilarityIndex.load(index_path)
+
+    start = time.perf_counter()
+    index = SimilarityIndex.build(
+        image_names, dataset_path / "embeddings", previous=previous, workers=args.workers
+    )
+    index.save(index_path)
+    print(
+        f"indexed {len(index)} of {len(image_names)} images in "
+        f"{time.perf_counter() - start:.1f}s, written to {index_path}"
+    )
+
+    start = time.perf_counter()
+    groups = index.duplicate_groups(args.duplicate_similarity)
+    duplicates_path = dataset_path / "near_duplicates.json"
+    with open(duplicates_path, "w") as f:
+        json.dump(groups, f, indent=4)
+    print(
+        f"found {len(groups)} groups of near-duplicates "
+        f"({sum(len(group) - 1 for group in groups)} frames that can be skipped) "
+        f"in {time.perf_counter() - start:.1f}s, written to {duplicates_path}"
+    )